@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import AggregatedRate
+from .models import AggregatedRate, CurrencyPair
 
 @admin.register(AggregatedRate)
 class AggregatedRateAdmin(admin.ModelAdmin):
@@ -7,3 +7,10 @@ class AggregatedRateAdmin(admin.ModelAdmin):
     list_filter = ('base_currency', 'target_currency')
     search_fields = ('base_currency', 'target_currency')
     ordering = ('-fetched_at',)
+
+
+@admin.register(CurrencyPair)
+class CurrencyPairAdmin(admin.ModelAdmin):
+    list_display = ('base_currency', 'target_currency', 'is_active')
+    list_filter = ('is_active',)
+    ordering = ('base_currency', 'target_currency')
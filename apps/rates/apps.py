@@ -1,3 +1,5 @@
+import sys
+
 from django.apps import AppConfig
 
 
@@ -6,8 +8,9 @@ class RatesConfig(AppConfig):
     name = 'apps.rates'
 
     def ready(self):
-        # Import and start scheduler only once
+        # Optional in-process scheduler (off by default); production runs
+        # `manage.py run_rate_worker` instead, which schedules cycles itself
         from django.conf import settings
-        if settings.SCHEDULER_AUTOSTART:
+        if settings.SCHEDULER_AUTOSTART and sys.argv[1:2] != ['run_rate_worker']:
             from .auto_fetch import start_scheduler
             start_scheduler()
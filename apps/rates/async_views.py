@@ -0,0 +1,169 @@
+"""
+Async views, served through wiremit_backend/asgi.py.
+
+DRF's @api_view is sync-only, so these are plain Django async views that
+authenticate with the same CookiesJWTAuthentication as the DRF views. The
+read views mirror their views.py counterparts under /api/rates/async/ and
+return identical payloads.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+
+from apps.users.authentication import CookiesJWTAuthentication
+
+from .caching import async_cached_rates_response
+from .models import AggregatedRate, LatestRate
+from .pagination import KeysetPaginator
+from .renderers import FastJSONRenderer
+from .stream import snapshot_events
+from .views import LATEST_RATE_FIELDS, RATE_FIELDS, local_day_bounds, serialize_rates
+
+
+def json_response(data, status=200):
+    return HttpResponse(FastJSONRenderer().render(data), status=status, content_type="application/json")
+
+
+async def authenticate_request(request):
+    """
+    Authenticate `request` from its JWT cookie or Authorization header.
+    Returns:
+        (user, None) on success, else (None, 401 response)
+    """
+    try:
+        result = await sync_to_async(CookiesJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed as e:
+        return None, json_response({"detail": str(e.detail)}, status=401)
+    if result is None:
+        return None, json_response({"detail": "Authentication credentials were not provided."}, status=401)
+    user, _ = result
+    if not user.is_active:
+        return None, json_response({"detail": "User is inactive."}, status=401)
+    return user, None
+
+
+def authenticated(view):
+    """Async counterpart of @permission_classes([IsAuthenticated]); sets request.user."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user, error = await authenticate_request(request)
+        if error is not None:
+            return error
+        request.user = user
+        return await view(request, *args, **kwargs)
+
+    return wrapper
+
+
+async def paginated_response(request, rates, not_found_detail):
+    """Async views.paginated_response."""
+    try:
+        paginator = KeysetPaginator(request)
+    except ParseError as e:
+        return json_response({"detail": str(e.detail)}, status=400)
+
+    rows = [row async for row in paginator.page_queryset(rates.values_list(*RATE_FIELDS, named=True))]
+    page, next_cursor, previous_cursor = paginator.build_page(rows)
+    if not page and paginator.is_first_page:
+        return json_response({"detail": not_found_detail}, status=404)
+    return json_response({
+        "count": await paginator.aget_count(rates),
+        "next": paginator.get_link(next_cursor),
+        "previous": paginator.get_link(previous_cursor),
+        "results": serialize_rates(page),
+    })
+
+
+async def latest_response(rates, not_found_detail):
+    rows = [row async for row in rates.order_by('base_currency', 'target_currency').values_list(*LATEST_RATE_FIELDS)]
+    if not rows:
+        return json_response({"detail": not_found_detail}, status=404)
+    return json_response({"count": len(rows), "results": serialize_rates(rows)})
+
+
+@require_GET
+@authenticated
+@async_cached_rates_response
+async def list_rates(request):
+    """Async views.list_rates."""
+    return await paginated_response(request, AggregatedRate.objects.all(), "No rates found.")
+
+
+@require_GET
+@authenticated
+@async_cached_rates_response
+async def rates_for_currency(request, currency):
+    """Async views.rates_for_currency."""
+    currency = currency.upper()
+    rates = AggregatedRate.objects.filter(Q(base_currency=currency) | Q(target_currency=currency))
+    return await paginated_response(request, rates, f"No rates found for currency '{currency}'")
+
+
+@require_GET
+@authenticated
+@async_cached_rates_response
+async def latest_rates_all(request):
+    """Async views.latest_rates_all."""
+    return await latest_response(LatestRate.objects.all(), "No rates found.")
+
+
+@require_GET
+@authenticated
+@async_cached_rates_response
+async def latest_rates_currency(request, currency):
+    """Async views.latest_rates_currency."""
+    currency = currency.upper()
+    rates = LatestRate.objects.filter(Q(base_currency=currency) | Q(target_currency=currency))
+    return await latest_response(rates, f"No latest rates found for currency '{currency}'")
+
+
+@require_GET
+@authenticated
+@async_cached_rates_response
+async def historical_rates_all(request):
+    """Async views.historical_rates_all."""
+    currency = request.GET.get('currency', None)
+    date_str = request.GET.get('date', None)
+    rates = AggregatedRate.objects.all()
+
+    if currency:
+        currency = currency.upper()
+        rates = rates.filter(Q(base_currency=currency) | Q(target_currency=currency))
+
+    if date_str:
+        try:
+            start, end = local_day_bounds(date_str)
+        except ValueError:
+            return json_response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+        rates = rates.filter(fetched_at__range=(start, end))
+
+    not_found_detail = (
+        f"No historical rates found for currency '{currency}' on date '{date_str}'"
+        if currency or date_str else "No historical rates found."
+    )
+    return await paginated_response(request, rates, not_found_detail)
+
+
+@require_GET
+@authenticated
+async def rates_stream(request):
+    """
+    Server-Sent Events stream of the latest rates. An event named `snapshot`
+    is sent on connect and after every new snapshot; reconnecting clients
+    send Last-Event-ID and skip a snapshot they already have.
+    Only served through ASGI: under WSGI, Django would buffer the endless
+    async stream into a list and hold a worker thread forever.
+    """
+    if not hasattr(request, "scope"):
+        return json_response({"detail": "The rate stream needs an ASGI server (wiremit_backend.asgi)."}, status=501)
+    response = StreamingHttpResponse(
+        snapshot_events(request.headers.get("Last-Event-ID")),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # stop nginx from buffering the stream
+    return response
@@ -1,24 +1,42 @@
-from apscheduler.schedulers.background import BackgroundScheduler
-from apps.rates.services import aggregate_and_store_rates
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections
+from apps.rates.caching import require_shared_cache
+from apps.rates.clients import client_metrics
+from apps.rates.locks import acquire_lease
+from apps.rates.metrics import CYCLE_SECONDS, CYCLES, SKIPPED_TICKS
+from apps.rates.retention import prune_rates
+from apps.rates.services import aggregate_and_store_rates, lease_min_interval
 import threading
+import time
 import logging
 
 # -------------------------------
 # Logger Setup (single logger)
 # -------------------------------
 logger = logging.getLogger("forex_scheduler")
-logger.setLevel(logging.INFO)
+logging_configured = False
 
-# File logging
-file_handler = logging.FileHandler("forex_aggregation.log")
-formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
 
-# Console logging
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
+def configure_logging(log_file=None, level=logging.INFO):
+    """
+    Log forex_scheduler to the console and, if given, to `log_file`.
+    Called by processes that run the scheduler, not at import time.
+    """
+    global logging_configured
+    if logging_configured:
+        return
+    logging_configured = True
+
+    logger.setLevel(level)
+    logger.propagate = False
+    formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
 
 # -------------------------------
 # Scheduler Duplicate Prevention
@@ -26,50 +44,200 @@ logger.addHandler(console_handler)
 scheduler_started = False
 
 # -------------------------------
-# Threaded Aggregation
+# Aggregation
 # -------------------------------
-def run_aggregate_sync():
-    def task():
-        logger.info("Starting scheduled forex rate aggregation...")
-        try:
-            result, api_status = aggregate_and_store_rates()
-            for api_name, status, message in api_status:
-                if status:
-                    logger.info(f"{api_name} fetch successful: {message}")
-                else:
-                    logger.warning(f"{api_name} fetch failed: {message}")
-
-            if result:
-                logger.info("Forex rates aggregated and stored successfully.")
+def run_aggregation_cycle(min_interval=None):
+    """
+    One logged aggregation cycle. `min_interval` is passed to
+    aggregate_and_store_rates. Returns True if rates were stored.
+    """
+    logger.info("Starting scheduled forex rate aggregation...")
+    try:
+        result, api_status = aggregate_and_store_rates(min_interval=min_interval)
+        for api_name, status, message in api_status:
+            if status:
+                logger.info(f"{api_name} fetch successful: {message}")
             else:
-                logger.warning("Aggregation completed but no rates were stored.")
-        except Exception as e:
-            logger.exception(f"Unexpected error during forex rate aggregation: {e}")
+                logger.warning(f"{api_name} fetch failed: {message}")
+
+        for api_name, metrics in client_metrics().items():
+            logger.info(
+                f"{api_name} connections: {metrics['connections_opened']} opened, "
+                f"{metrics['connections_reused']} reused, "
+                f"avg handshake {metrics['handshake_seconds_avg'] * 1000:.1f} ms"
+            )
+
+        if result:
+            logger.info("Forex rates aggregated and stored successfully.")
+        else:
+            logger.warning("Aggregation completed but no rates were stored.")
+        return result
+    except Exception as e:
+        logger.exception(f"Unexpected error during forex rate aggregation: {e}")
+        return False
+
+
+class AggregationRunner:
+    """
+    Runs aggregation cycles on one long-lived thread, one cycle at a time.
+    A tick that arrives while a cycle is running is skipped and counted,
+    not queued. Each cycle is timed, and DB connections are closed around
+    it, so a slow cycle can't leak or pile up connections.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rates-aggregation")
+        self._lock = threading.Lock()
+        self.running = False
+        self.cycles = 0
+        self.skipped_ticks = 0
+        self.last_cycle_seconds = None
+        self.total_cycle_seconds = 0.0
+
+    def submit(self, min_interval=None):
+        """
+        Start a cycle with the lease's `min_interval` (see
+        aggregate_and_store_rates). Returns its Future, or None if a cycle
+        is already running.
+        """
+        with self._lock:
+            if self.running:
+                self.skipped_ticks += 1
+                SKIPPED_TICKS.inc()
+                logger.warning(f"Previous aggregation cycle still running; skipping tick ({self.skipped_ticks} skipped so far).")
+                return None
+            self.running = True
+        return self.executor.submit(self._run, min_interval)
+
+    def record_skipped(self, ticks=1):
+        with self._lock:
+            self.skipped_ticks += ticks
+        SKIPPED_TICKS.inc(ticks)
+
+    def _run(self, min_interval):
+        close_old_connections()
+        start = time.perf_counter()
+        result = False
+        try:
+            result = run_aggregation_cycle(min_interval)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            close_old_connections()
+            CYCLE_SECONDS.observe(elapsed)
+            CYCLES.inc(result="stored" if result else "not_stored")
+            with self._lock:
+                self.running = False
+                self.cycles += 1
+                self.last_cycle_seconds = elapsed
+                self.total_cycle_seconds += elapsed
+            logger.info(f"Aggregation cycle took {elapsed:.2f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "running": self.running,
+                "cycles": self.cycles,
+                "skipped_ticks": self.skipped_ticks,
+                "last_cycle_seconds": self.last_cycle_seconds,
+                "avg_cycle_seconds": self.total_cycle_seconds / self.cycles if self.cycles else None,
+            }
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+aggregation_runner = AggregationRunner()
 
-    threading.Thread(target=task, daemon=True).start()
+
+def run_aggregate_sync(min_interval=None):
+    """
+    Scheduler job: run one cycle on the aggregation runner and wait for it,
+    so APScheduler's max_instances / coalesce see the job as running.
+    """
+    future = aggregation_runner.submit(min_interval)
+    if future is not None:
+        future.result()
+
+# -------------------------------
+# Daily Retention
+# -------------------------------
+RETENTION_LEASE = "prune_rates"
+RETENTION_MIN_INTERVAL = 20 * 60 * 60  # one run per day across all workers
+
+
+def retention_time():
+    """settings.RATES_RETENTION_TIME ("HH:MM", CAT) as (hour, minute)."""
+    hour, minute = settings.RATES_RETENTION_TIME.split(":")
+    return int(hour), int(minute)
+
+
+def run_retention():
+    """Daily pruning, once per day across all workers."""
+    lease = acquire_lease(RETENTION_LEASE, ttl=settings.RATES_LEASE_TTL, min_interval=RETENTION_MIN_INTERVAL)
+    if lease is None:
+        logger.info("Retention already ran today or is running elsewhere. Skipping.")
+        return
+    try:
+        with lease.keepalive():
+            prune_rates()
+    except Exception as e:
+        logger.exception(f"Unexpected error during rate retention: {e}")
+    finally:
+        lease.release()
 
 # -------------------------------
 # Scheduler Starter
 # -------------------------------
-def start_scheduler(interval_minutes=1):
+def start_scheduler(interval_seconds=None):
+    """
+    Run aggregation and retention on an in-process APScheduler. Used when
+    SCHEDULER_AUTOSTART is on; `manage.py run_rate_worker` is the dedicated
+    alternative and does not need APScheduler.
+    """
+    from apscheduler.events import EVENT_JOB_MAX_INSTANCES
+    from apscheduler.schedulers.background import BackgroundScheduler
+
     global scheduler_started
     if scheduler_started:
         logger.info("Scheduler already running. Skipping start.")
         return
+    require_shared_cache()
     scheduler_started = True
 
+    if interval_seconds is None:
+        interval_seconds = settings.RATES_AGGREGATION_INTERVAL
+    configure_logging(settings.RATES_WORKER_LOG_FILE)
+
+    retention_hour, retention_minute = retention_time()
     scheduler = BackgroundScheduler(timezone="Africa/Harare")
+    # Ticks dropped by max_instances=1 count as skipped too
+    scheduler.add_listener(
+        lambda event: aggregation_runner.record_skipped() if event.job_id == "fetch_rates" else None,
+        EVENT_JOB_MAX_INSTANCES,
+    )
     try:
         scheduler.add_job(
             run_aggregate_sync,
             "interval",
-            minutes=interval_minutes,
+            seconds=interval_seconds,
+            kwargs={"min_interval": lease_min_interval(interval_seconds)},
             id="fetch_rates",
             replace_existing=True,
             coalesce=True,
             max_instances=1,
         )
+        scheduler.add_job(
+            run_retention,
+            "cron",
+            hour=retention_hour,
+            minute=retention_minute,
+            id="prune_rates",
+            replace_existing=True,
+            coalesce=True,
+            max_instances=1,
+        )
         scheduler.start()
-        logger.info(f"APScheduler started, running every {interval_minutes} minutes")
+        logger.info(f"APScheduler started, running every {interval_seconds} seconds")
     except Exception as e:
         logger.exception(f"Failed to start APScheduler: {e}")
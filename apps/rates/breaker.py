@@ -0,0 +1,85 @@
+"""
+Per-provider circuit breakers.
+
+State lives in the Django cache, which must be shared between processes
+(see caching.require_shared_cache), so every worker sees the same breaker:
+
+    closed     calls go through; consecutive failures are counted, and after
+               RATES_BREAKER_FAILURE_THRESHOLD of them the breaker opens
+    open       calls are skipped until the cooldown ends. The cooldown starts
+               at RATES_BREAKER_COOLDOWN, doubles on every failed probe
+               (capped at RATES_BREAKER_MAX_COOLDOWN) and follows the
+               provider's Retry-After / rate-limit reset when it sent one
+    half-open  cooldown over: one process at a time makes a trial call;
+               success closes the breaker, failure re-opens it
+
+Permanent failures (revoked key, exhausted quota) open the breaker at once
+for the maximum cooldown.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        slug = name.lower().replace(" ", "_")
+        self.key = f"rates:breaker:{slug}"
+        self.probe_key = f"rates:breaker:{slug}:probe"
+
+    def _load(self):
+        return cache.get(self.key) or {"state": CLOSED, "failures": 0, "open_until": 0, "cooldown": 0}
+
+    @property
+    def state(self):
+        data = self._load()
+        if data["state"] == OPEN and time.time() >= data["open_until"]:
+            return HALF_OPEN
+        return data["state"]
+
+    @property
+    def open_until(self):
+        return self._load()["open_until"]
+
+    def allow(self):
+        """Whether a call may be made now. In half-open state only one caller gets True."""
+        data = self._load()
+        if data["state"] == CLOSED:
+            return True
+        if time.time() < data["open_until"]:
+            return False
+        return cache.add(self.probe_key, True, timeout=settings.RATES_BREAKER_COOLDOWN)
+
+    def record_success(self):
+        cache.set(self.key, {"state": CLOSED, "failures": 0, "open_until": 0, "cooldown": 0}, timeout=None)
+        cache.delete(self.probe_key)
+
+    def record_failure(self, retry_after=None, permanent=False):
+        data = self._load()
+        failures = data["failures"] + 1
+        if permanent:
+            cooldown = settings.RATES_BREAKER_MAX_COOLDOWN
+        elif data["state"] == OPEN:
+            # A failed half-open probe: back off further
+            cooldown = min(max(data["cooldown"] * 2, settings.RATES_BREAKER_COOLDOWN), settings.RATES_BREAKER_MAX_COOLDOWN)
+        elif failures >= settings.RATES_BREAKER_FAILURE_THRESHOLD or retry_after is not None:
+            cooldown = settings.RATES_BREAKER_COOLDOWN
+        else:
+            cache.set(self.key, {**data, "failures": failures}, timeout=None)
+            return
+
+        if retry_after is not None:
+            cooldown = max(cooldown, retry_after)
+        cache.set(self.key, {
+            "state": OPEN,
+            "failures": failures,
+            "open_until": time.time() + cooldown,
+            "cooldown": cooldown,
+        }, timeout=None)
+        cache.delete(self.probe_key)
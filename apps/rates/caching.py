@@ -0,0 +1,163 @@
+"""
+Read-through response cache for the rate endpoints.
+
+Cached payloads are keyed by the version of the latest committed snapshot,
+so a new snapshot invalidates every entry at once without deleting keys.
+The same version backs the ETag / Last-Modified headers, which lets polling
+clients revalidate with a 304 that never reaches the database.
+"""
+import hashlib
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .metrics import RESPONSE_CACHE
+from .models import LatestRate
+
+SNAPSHOT_KEY = "rates:snapshot"
+RESPONSE_KEY_PREFIX = "rates:response"
+
+# Cache backends whose entries never leave the process
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def require_shared_cache():
+    """
+    Raise ImproperlyConfigured unless the default cache is shared between
+    processes. Processes that call the providers keep the circuit breakers
+    (breaker.py), the quota ledger and the ETag / Last-Modified validators
+    (provider_cache.py) in it; with a per-process cache every process would
+    run its own breakers and spend the whole monthly quota on its own.
+    RATES_ALLOW_LOCAL_CACHE opts out for single-process setups such as
+    development.
+    """
+    backend = settings.CACHES['default']['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES and not settings.RATES_ALLOW_LOCAL_CACHE:
+        raise ImproperlyConfigured(
+            f"The default cache ({backend}) is local to each process, so provider circuit breakers "
+            "and quota ledgers would not be shared. Set CACHE_BACKEND to a shared backend such as Redis, or "
+            "RATES_ALLOW_LOCAL_CACHE=true to run a single process."
+        )
+
+
+def publish_snapshot(fetched_at):
+    """
+    Record `fetched_at` as the latest snapshot. Called by the aggregator
+    once a snapshot has committed. An older snapshot committing late does
+    not replace a newer one.
+    """
+    current = cache.get(SNAPSHOT_KEY)
+    if current is not None and current["fetched_at"] > fetched_at:
+        return current
+    snapshot = {
+        "version": str(int(fetched_at.timestamp() * 1_000_000)),
+        "fetched_at": fetched_at,
+    }
+    # With a shared cache this makes the new snapshot visible to every
+    # process at once; the TTL bounds staleness for per-process caches.
+    cache.set(SNAPSHOT_KEY, snapshot, timeout=settings.RATES_SNAPSHOT_CACHE_TTL)
+    return snapshot
+
+
+def get_snapshot():
+    """
+    The latest snapshot's {"version", "fetched_at"}, or None before the
+    first snapshot. Falls back to LatestRate when the cache is cold.
+    """
+    snapshot = cache.get(SNAPSHOT_KEY)
+    if snapshot is None:
+        fetched_at = LatestRate.objects.aggregate(latest=Max('fetched_at'))['latest']
+        if fetched_at is not None:
+            snapshot = publish_snapshot(fetched_at)
+    return snapshot
+
+
+def response_cache_key(request, version):
+    # Host is part of the key because paginated payloads embed absolute links
+    query = sorted((k, v) for k, values in request.GET.lists() for v in values)
+    raw = f"{request.get_host()}|{request.path}|{query}"
+    return f"{RESPONSE_KEY_PREFIX}:{version}:{hashlib.md5(raw.encode()).hexdigest()}"
+
+
+def cached_rates_response(view):
+    """
+    Cache a rate read view's response per snapshot, and answer conditional
+    GETs with 304. Apply below @api_view / @permission_classes so
+    authentication still runs first.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        snapshot = get_snapshot()
+        if snapshot is None:
+            return view(request, *args, **kwargs)
+
+        etag = f'"{snapshot["version"]}"'
+        last_modified = int(snapshot["fetched_at"].timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            RESPONSE_CACHE.inc(result="not_modified")
+        else:
+            key = response_cache_key(request, snapshot["version"])
+            cached = cache.get(key)
+            RESPONSE_CACHE.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                status, data = cached
+                response = Response(data, status=status)
+            else:
+                response = view(request, *args, **kwargs)
+                if response.status_code in (200, 404):
+                    cache.set(key, (response.status_code, response.data), timeout=settings.RATES_RESPONSE_CACHE_TTL)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
+
+
+def async_cached_rates_response(view):
+    """
+    cached_rates_response for the async views in async_views.py, which
+    return plain HttpResponses; the encoded body is cached.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        snapshot = await sync_to_async(get_snapshot)()
+        if snapshot is None:
+            return await view(request, *args, **kwargs)
+
+        etag = f'"{snapshot["version"]}"'
+        last_modified = int(snapshot["fetched_at"].timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            RESPONSE_CACHE.inc(result="not_modified")
+        else:
+            key = response_cache_key(request, snapshot["version"])
+            cached = await cache.aget(key)
+            RESPONSE_CACHE.inc(result="miss" if cached is None else "hit")
+            if cached is not None:
+                status, content = cached
+                response = HttpResponse(content, status=status, content_type="application/json")
+            else:
+                response = await view(request, *args, **kwargs)
+                if response.status_code in (200, 404):
+                    await cache.aset(key, (response.status_code, response.content), timeout=settings.RATES_RESPONSE_CACHE_TTL)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
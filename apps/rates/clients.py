@@ -0,0 +1,179 @@
+"""
+Long-lived HTTP clients for the rate providers.
+
+Each provider gets one pooled requests.Session so TCP connections and TLS
+sessions are reused across retries and scheduler cycles instead of being
+re-established on every call.
+"""
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ProviderHTTPError(Exception):
+    """
+    A provider answered 429 or 5xx. `retry_after` is the wait in seconds the
+    provider asked for (Retry-After or rate-limit reset headers), if any.
+    """
+
+    def __init__(self, message, status_code, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers):
+    """Seconds to wait according to Retry-After or X-RateLimit-Reset / RateLimit-Reset, or None."""
+    value = headers.get("Retry-After")
+    if value:
+        if value.strip().isdigit():
+            return float(value)
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+
+    for header in ("X-RateLimit-Reset", "RateLimit-Reset"):
+        value = headers.get(header)
+        if not value:
+            continue
+        try:
+            reset = float(value)
+        except ValueError:
+            continue
+        # Either an epoch timestamp or a delay in seconds
+        return max(reset - time.time(), 0.0) if reset > 1_000_000_000 else reset
+    return None
+
+
+class ConnectionMetrics:
+    """Thread-safe counters for requests sent and connections opened by a client."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.handshake_seconds = 0.0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_connect(self, seconds):
+        with self._lock:
+            self.connections_opened += 1
+            self.handshake_seconds += seconds
+
+    def snapshot(self):
+        with self._lock:
+            opened = self.connections_opened
+            return {
+                "requests": self.requests,
+                "connections_opened": opened,
+                "connections_reused": max(self.requests - opened, 0),
+                "handshake_seconds_total": self.handshake_seconds,
+                "handshake_seconds_avg": self.handshake_seconds / opened if opened else 0.0,
+            }
+
+
+class _TimedConnectMixin:
+    """Times connect(), i.e. the TCP (and TLS) handshake of a new connection."""
+    metrics = None
+
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        self.metrics.record_connect(time.perf_counter() - start)
+
+
+def _instrumented_pool_classes(metrics):
+    http_conn = type("TimedHTTPConnection", (_TimedConnectMixin, HTTPConnection), {"metrics": metrics})
+    https_conn = type("TimedHTTPSConnection", (_TimedConnectMixin, HTTPSConnection), {"metrics": metrics})
+    return {
+        "http": type("TimedHTTPConnectionPool", (HTTPConnectionPool,), {"ConnectionCls": http_conn}),
+        "https": type("TimedHTTPSConnectionPool", (HTTPSConnectionPool,), {"ConnectionCls": https_conn}),
+    }
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools report new connections to a ConnectionMetrics."""
+
+    def __init__(self, metrics, **kwargs):
+        # Set before super().__init__, which builds the pool manager
+        self.metrics = metrics
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _instrumented_pool_classes(self.metrics)
+
+
+class ProviderClient:
+    """
+    Keep-alive HTTP client for a single rate provider.
+    Timeouts default to settings.RATES_HTTP_CONNECT_TIMEOUT / RATES_HTTP_READ_TIMEOUT.
+    """
+
+    def __init__(self, name, pool_size=None, connect_timeout=None, read_timeout=None):
+        self.name = name
+        self.timeout = (
+            connect_timeout or settings.RATES_HTTP_CONNECT_TIMEOUT,
+            read_timeout or settings.RATES_HTTP_READ_TIMEOUT,
+        )
+        self.metrics = ConnectionMetrics()
+
+        adapter = InstrumentedAdapter(
+            self.metrics,
+            pool_connections=1,
+            pool_maxsize=pool_size or settings.RATES_HTTP_POOL_SIZE,
+            max_retries=0,  # retries are handled by services.fetch_with_retry
+        )
+        self.session = requests.Session()
+        self.session.headers["Connection"] = "keep-alive"
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def get(self, url, **kwargs):
+        """
+        GET `url`. Raises ProviderHTTPError on 429 and 5xx; other responses
+        are returned for the caller to parse, including error bodies.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        self.metrics.record_request()
+        response = self.session.get(url, **kwargs)
+        if response.status_code == 429 or response.status_code >= 500:
+            raise ProviderHTTPError(
+                f"{self.name} returned HTTP {response.status_code}",
+                response.status_code,
+                retry_after=parse_retry_after(response.headers),
+            )
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name):
+    """Return the shared client for provider `name`, creating it on first use."""
+    with _clients_lock:
+        client = _clients.get(name)
+        if client is None:
+            client = _clients[name] = ProviderClient(name)
+        return client
+
+
+def client_metrics():
+    """Connection metrics for every client created in this process, keyed by provider."""
+    with _clients_lock:
+        clients = list(_clients.values())
+    return {client.name: client.metrics.snapshot() for client in clients}
@@ -0,0 +1,105 @@
+"""
+Consensus stage of the aggregator: turns the per-provider quotes for one
+pair into a single rate.
+
+1. Staleness: quotes whose provider timestamp is older than
+   RATES_MAX_QUOTE_AGE seconds are rejected.
+2. Outliers: with three or more quotes, a quote whose robust z-score
+   0.6745 * |x - median| / MAD exceeds RATES_OUTLIER_MAD_THRESHOLD is
+   rejected. MAD is floored at MAD_FLOOR of the median so near-identical
+   quotes do not turn every tiny difference into an outlier: with the
+   default threshold, a quote within about 0.5% of the median is always
+   kept, which covers the usual spread between public rate APIs.
+3. Estimator (RATES_AGGREGATION_METHOD) over the remaining quotes:
+   mean, median, trimmed_mean (RATES_TRIM_FRACTION cut from each end) or
+   weighted_mean (RATES_PROVIDER_WEIGHTS, default weight 1).
+
+Every quote gets a decision record, stored with the snapshot row.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from .crossrates import quantize_rate
+
+MAD_SCALE = Decimal("0.6745")
+MAD_FLOOR = Decimal("0.001")  # 10 bp of the median
+METHODS = ('mean', 'median', 'trimmed_mean', 'weighted_mean')
+
+
+def median(values):
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    if len(ordered) % 2:
+        return ordered[middle]
+    return (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def trimmed_mean(values, fraction):
+    ordered = sorted(values)
+    cut = int(len(ordered) * fraction)
+    kept = ordered[cut:len(ordered) - cut] or ordered
+    return sum(kept) / Decimal(len(kept))
+
+
+def estimate(quotes, method, weights):
+    values = [rate for _, rate in quotes]
+    if method == 'median':
+        return median(values)
+    if method == 'trimmed_mean':
+        return trimmed_mean(values, settings.RATES_TRIM_FRACTION)
+    if method == 'weighted_mean':
+        provider_weights = [Decimal(str(weights.get(provider, 1))) for provider, _ in quotes]
+        total = sum(provider_weights)
+        if total > 0:
+            return sum(w * rate for w, (_, rate) in zip(provider_weights, quotes)) / total
+    return sum(values) / Decimal(len(values))
+
+
+def outliers(quotes, threshold):
+    """Providers whose quote is a MAD outlier among `quotes`."""
+    if len(quotes) < 3:
+        return set()
+    center = median([rate for _, rate in quotes])
+    mad = median([abs(rate - center) for _, rate in quotes])
+    mad = max(mad, abs(center) * MAD_FLOOR)
+    if not mad:
+        return set()
+    return {provider for provider, rate in quotes if MAD_SCALE * abs(rate - center) / mad > threshold}
+
+
+def aggregate_quotes(quotes, quoted_at, now, method=None):
+    """
+    quotes: [(provider, rate), ...] for one pair
+    quoted_at: {provider: datetime or None} provider-reported quote times
+    Returns:
+        rate (Decimal, or None if every quote was rejected),
+        sources (list of {"provider", "rate", "used", "reason"})
+    """
+    method = method or settings.RATES_AGGREGATION_METHOD
+    max_age = settings.RATES_MAX_QUOTE_AGE
+    rejected = {}
+
+    if max_age is not None:
+        for provider, _ in quotes:
+            at = quoted_at.get(provider)
+            if at is not None and (now - at).total_seconds() > max_age:
+                rejected[provider] = "stale"
+
+    fresh = [quote for quote in quotes if quote[0] not in rejected]
+    for provider in outliers(fresh, settings.RATES_OUTLIER_MAD_THRESHOLD):
+        rejected[provider] = "outlier"
+
+    used = [quote for quote in fresh if quote[0] not in rejected]
+    rate = estimate(used, method, settings.RATES_PROVIDER_WEIGHTS) if used else None
+
+    sources = [
+        {
+            "provider": provider,
+            "rate": str(quantize_rate(value)),
+            "used": provider not in rejected,
+            "reason": rejected.get(provider, ""),
+        }
+        for provider, value in quotes
+    ]
+    return rate, sources
@@ -0,0 +1,48 @@
+"""
+Cross-rate engine.
+
+Providers quote every currency of the universe against their own base
+currency (a quote vector: units of currency per 1 unit of base). The rate of
+any pair A->B from one provider is vector[B] / vector[A]. Instead of
+dividing once per pair, each provider's vector is inverted once and every
+pair becomes a single multiplication, so a cycle over N currencies costs
+N divisions plus one multiplication per requested pair and provider.
+
+Arithmetic uses a local Decimal context with RATE_PRECISION significant
+digits; stored rates are quantized to RATE_QUANTUM with ROUND_HALF_EVEN.
+"""
+from decimal import ROUND_HALF_EVEN, Decimal, localcontext
+
+RATE_PRECISION = 28
+RATE_DECIMAL_PLACES = 10  # matches AggregatedRate decimal_places
+RATE_QUANTUM = Decimal(1).scaleb(-RATE_DECIMAL_PLACES)
+
+
+def quote_vector(data, currencies):
+    """{currency: Decimal} for the currencies of the universe present in `data`."""
+    return {currency: Decimal(str(data[currency])) for currency in currencies if currency in data}
+
+
+def cross_rates(quotes, pairs):
+    """
+    quotes: list of (provider, quote vector)
+    pairs: list of (base, target)
+    Returns:
+        {(base, target): [(provider, rate), ...]} for pairs quoted by at least one provider
+    """
+    results = {}
+    with localcontext() as ctx:
+        ctx.prec = RATE_PRECISION
+        for provider, vector in quotes:
+            inverse = {currency: 1 / value for currency, value in vector.items() if value}
+            for base, target in pairs:
+                base_inverse = inverse.get(base)
+                target_value = vector.get(target)
+                if base_inverse is None or target_value is None:
+                    continue
+                results.setdefault((base, target), []).append((provider, target_value * base_inverse))
+    return results
+
+
+def quantize_rate(value):
+    return value.quantize(RATE_QUANTUM, rounding=ROUND_HALF_EVEN)
@@ -0,0 +1,48 @@
+"""
+Streaming encoders for the historical rate export endpoint.
+
+Each encoder takes an iterator of serialized rate dicts and yields encoded
+chunks of EXPORT_BATCH_ROWS rows, so the response is written in reasonably
+sized blocks while only one batch is held in memory.
+"""
+import csv
+from itertools import islice
+
+from .renderers import json_bytes
+
+EXPORT_BATCH_ROWS = 1000
+CSV_COLUMNS = ('id', 'base_currency', 'target_currency', 'average_rate', 'markup_rate', 'fetched_at')
+
+
+class Echo:
+    """File-like object whose write() returns the value, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def _batches(items):
+    while True:
+        batch = list(islice(items, EXPORT_BATCH_ROWS))
+        if not batch:
+            return
+        yield batch
+
+
+def csv_stream(items):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for batch in _batches(items):
+        yield ''.join(writer.writerow([item[column] for column in CSV_COLUMNS]) for item in batch)
+
+
+def ndjson_stream(items):
+    for batch in _batches(items):
+        yield b''.join(json_bytes(item) + b'\n' for item in batch)
+
+
+# format -> (encoder, content type)
+EXPORT_FORMATS = {
+    'csv': (csv_stream, 'text/csv'),
+    'ndjson': (ndjson_stream, 'application/x-ndjson'),
+}
@@ -0,0 +1,107 @@
+"""
+Database-backed leases that coordinate scheduled jobs across worker
+processes and hosts.
+
+A lease is held for a limited time and renewed while its job runs. Every
+acquisition bumps the lease's fencing token, and writes check that token
+inside their transaction, so a holder that stalled past expiry cannot
+commit over a newer holder.
+"""
+import logging
+import os
+import socket
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import SchedulerLease
+
+logger = logging.getLogger("forex_scheduler")
+
+
+class LeaseLost(Exception):
+    """The lease expired or was taken over by another owner."""
+
+
+class Lease:
+    def __init__(self, name, owner, token, ttl):
+        self.name = name
+        self.owner = owner
+        self.token = token
+        self.ttl = ttl  # seconds
+
+    def _held(self):
+        return SchedulerLease.objects.filter(name=self.name, owner=self.owner, token=self.token)
+
+    def renew(self):
+        expires_at = timezone.now() + timedelta(seconds=self.ttl)
+        if not self._held().update(expires_at=expires_at):
+            raise LeaseLost(f"Lease '{self.name}' (token {self.token}) is no longer held")
+
+    def fence(self):
+        """
+        Call inside the transaction that writes the job's results: locks the
+        lease row until commit and raises LeaseLost unless it is still ours.
+        """
+        held = self._held().select_for_update().filter(expires_at__gt=timezone.now()).exists()
+        if not held:
+            raise LeaseLost(f"Lease '{self.name}' (token {self.token}) expired before commit")
+
+    def release(self):
+        # Expire the lease but keep last_started_at so the interval still applies
+        self._held().update(expires_at=timezone.now())
+
+    @contextmanager
+    def keepalive(self):
+        """Renew the lease in a background thread every ttl/3 seconds."""
+        stop = threading.Event()
+
+        def renew_loop():
+            try:
+                while not stop.wait(self.ttl / 3):
+                    try:
+                        self.renew()
+                    except LeaseLost as e:
+                        logger.warning(str(e))
+                        return
+                    except Exception as e:
+                        logger.warning(f"Failed to renew lease '{self.name}': {e}")
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=renew_loop, name=f"lease-{self.name}", daemon=True)
+        thread.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            thread.join()
+
+
+def acquire_lease(name, ttl, min_interval=0):
+    """
+    Try to take lease `name` for `ttl` seconds. Returns a Lease, or None when
+    another owner holds it or the job last started less than `min_interval`
+    seconds ago.
+    """
+    now = timezone.now()
+    owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    with transaction.atomic():
+        lease, _ = SchedulerLease.objects.select_for_update().get_or_create(name=name)
+        if lease.expires_at and lease.expires_at > now:
+            return None
+        if lease.last_started_at and now - lease.last_started_at < timedelta(seconds=min_interval):
+            return None
+
+        lease.owner = owner
+        lease.token += 1
+        lease.expires_at = now + timedelta(seconds=ttl)
+        lease.last_started_at = now
+        lease.save()
+
+    return Lease(name, owner, lease.token, ttl)
@@ -0,0 +1,68 @@
+"""
+As-of rate lookups: the rate in effect for a pair at a given time, i.e. the
+newest AggregatedRate of the pair fetched at or before that time.
+
+A whole batch of lookups is resolved by one SQL query. The lookups are sent
+as a VALUES list, and each one is matched to a single row with an index seek
+on rates_pair_fetched_idx. PostgreSQL runs this as a LATERAL join; other
+databases use an equivalent correlated subquery.
+"""
+from django.db import connection
+
+from .models import AggregatedRate
+
+RATE_COLUMNS = ('id', 'base_currency', 'target_currency', 'average_rate', 'markup_rate', 'fetched_at')
+
+LATERAL_SQL = """
+SELECT l.idx, {columns}
+FROM (VALUES {values}) AS l (idx, base, target, at)
+JOIN LATERAL (
+    SELECT {columns}
+    FROM {table} AS r
+    WHERE r.base_currency = l.base AND r.target_currency = l.target AND r.fetched_at <= l.at
+    ORDER BY r.fetched_at DESC, r.id DESC
+    LIMIT 1
+) AS r ON TRUE
+"""
+
+SUBQUERY_SQL = """
+WITH l (idx, base, target, at) AS (VALUES {values})
+SELECT l.idx, {columns}
+FROM l
+JOIN {table} AS r ON r.id = (
+    SELECT r2.id
+    FROM {table} AS r2
+    WHERE r2.base_currency = l.base AND r2.target_currency = l.target AND r2.fetched_at <= l.at
+    ORDER BY r2.fetched_at DESC, r2.id DESC
+    LIMIT 1
+)
+"""
+
+
+def rates_as_of(lookups):
+    """
+    lookups: list of (base, target, aware datetime)
+    Returns:
+        list of AggregatedRate (or None where the pair has no rate yet),
+        in the order of `lookups`
+    """
+    if not lookups:
+        return []
+
+    unique = list(dict.fromkeys(lookups))
+    if connection.vendor == 'postgresql':
+        template, row = LATERAL_SQL, "(%s, %s, %s, %s::timestamptz)"
+    else:
+        template, row = SUBQUERY_SQL, "(%s, %s, %s, %s)"
+    sql = template.format(
+        values=", ".join([row] * len(unique)),
+        columns=", ".join(f"r.{column}" for column in RATE_COLUMNS),
+        table=connection.ops.quote_name(AggregatedRate._meta.db_table),
+    )
+    params = []
+    for idx, (base, target, at) in enumerate(unique):
+        params.extend([idx, base, target, connection.ops.adapt_datetimefield_value(at)])
+
+    found = {rate.idx: rate for rate in AggregatedRate.objects.raw(sql, params)}
+    by_lookup = {lookup: found.get(idx) for idx, lookup in enumerate(unique)}
+    return [by_lookup[lookup] for lookup in lookups]
@@ -1,11 +1,18 @@
-from django.core.management.base import BaseCommand
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from apps.rates.caching import require_shared_cache
 from apps.rates.services import aggregate_and_store_rates  # import the actual function
 
 class Command(BaseCommand):
     help = "Fetch and store aggregated forex rates from APIs"
 
     def handle(self, *args, **kwargs):
-        success = aggregate_and_store_rates()  # call it directly
+        try:
+            require_shared_cache()
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        # Manual runs ignore the interval but still wait for any running cycle
+        success, _ = aggregate_and_store_rates(min_interval=0)
         if success:
             self.stdout.write(self.style.SUCCESS("Forex rates fetched and stored successfully."))
         else:
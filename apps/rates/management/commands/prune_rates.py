@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.rates.retention import prune_rates
+
+
+class Command(BaseCommand):
+    help = "Compact old raw rates into rollups and delete them in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.RATES_RAW_RETENTION_DAYS,
+                            help="Keep raw rates for this many days (default: RATES_RAW_RETENTION_DAYS). "
+                                 "rebuild_rate_rollups relies on the setting, so lower it too")
+        parser.add_argument('--batch-size', type=int, default=settings.RATES_RETENTION_BATCH_SIZE,
+                            help="Rows deleted per transaction")
+        parser.add_argument('--pause', type=float, default=0,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--no-compact', action='store_true',
+                            help="Delete raw rates without building missing rollups first")
+
+    def handle(self, *args, **options):
+        result = prune_rates(
+            raw_days=options['days'],
+            batch_size=options['batch_size'],
+            compact=not options['no_compact'],
+            pause=options['pause'],
+        )
+        summary = ", ".join(f"{name}: {count}" for name, count in result.items())
+        self.stdout.write(self.style.SUCCESS(f"Pruned rates ({summary})."))
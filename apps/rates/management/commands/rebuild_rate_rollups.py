@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.timezone import localtime
+
+from apps.rates.models import AggregatedRate
+from apps.rates.rollups import earliest_rebuildable_day, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild OHLC rate rollups from raw AggregatedRate history. Only days "
+        "within RATES_RAW_RETENTION_DAYS can be rebuilt: older raw rates have "
+        "been pruned and their rollups are kept as they are."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1,
+                            help="Rebuild this many days back, including today (default: 1). "
+                                 "Must not reach past RATES_RAW_RETENTION_DAYS")
+        parser.add_argument('--all', action='store_true',
+                            help="Rebuild from the oldest stored rate still within RATES_RAW_RETENTION_DAYS")
+
+    def handle(self, *args, **options):
+        end = timezone.localdate()
+        earliest = earliest_rebuildable_day()
+        if options['all']:
+            oldest = AggregatedRate.objects.order_by('fetched_at').values_list('fetched_at', flat=True).first()
+            if oldest is None:
+                self.stdout.write("No rates stored. Nothing to rebuild.")
+                return
+            start = max(localtime(oldest).date(), earliest)
+        else:
+            start = end - timedelta(days=options['days'] - 1)
+
+        try:
+            count = rebuild_rollups(start, end)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups for {start} to {end} from {count} rates."))
@@ -0,0 +1,197 @@
+import json
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+
+from apps.rates.auto_fetch import aggregation_runner, configure_logging, logger, retention_time, run_retention
+from apps.rates.caching import require_shared_cache
+from apps.rates.clients import get_client
+from apps.rates.metrics import CONTENT_TYPE, REGISTRY, scrape_refusal
+from apps.rates.services import PROVIDERS, lease_min_interval
+
+HEALTH_KEY = "rates:worker:health"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """Serves the worker's metrics registry at /metrics."""
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        refusal = scrape_refusal(self.headers.get("Authorization", ""))
+        if refusal is not None:
+            self.send_error(refusal)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would flood the worker log
+
+
+class Command(BaseCommand):
+    help = "Run the rate aggregation worker: aggregation every interval plus daily retention"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=settings.RATES_AGGREGATION_INTERVAL,
+                            help="Seconds between aggregation cycles (default: RATES_AGGREGATION_INTERVAL)")
+        parser.add_argument('--log-file', default=settings.RATES_WORKER_LOG_FILE,
+                            help="Also log to this file (default: RATES_WORKER_LOG_FILE; empty for console only)")
+        parser.add_argument('--health-file', default=settings.RATES_WORKER_HEALTH_FILE,
+                            help="Rewrite this JSON file with the worker's health after every cycle")
+        parser.add_argument('--metrics-port', type=int, default=settings.RATES_WORKER_METRICS_PORT,
+                            help="Serve Prometheus metrics on this port at /metrics (default: RATES_WORKER_METRICS_PORT; 0 = off)")
+        parser.add_argument('--no-retention', action='store_true',
+                            help="Don't run the daily retention job in this worker")
+
+    def handle(self, *args, **options):
+        try:
+            require_shared_cache()
+        except ImproperlyConfigured as e:
+            raise CommandError(e)
+        configure_logging(options['log_file'])
+        self.interval = options['interval']
+        self.health_file = options['health_file']
+        self.stopping = threading.Event()
+        self.retention_thread = None
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self.request_stop)
+
+        self.health = {
+            "pid": os.getpid(),
+            "host": socket.gethostname(),
+            "started_at": timezone.now().isoformat(),
+            "status": "running",
+            "interval": self.interval,
+            "cycles": 0,
+            "failures": 0,
+            "skipped_ticks": 0,
+            "last_cycle_at": None,
+            "last_success_at": None,
+            "last_cycle_seconds": None,
+        }
+        metrics_server = None
+        if options['metrics_port']:
+            metrics_server = ThreadingHTTPServer(("", options['metrics_port']), MetricsHandler)
+            threading.Thread(target=metrics_server.serve_forever, name="rates-metrics", daemon=True).start()
+            logger.info(f"Serving metrics on port {options['metrics_port']}")
+
+        logger.info(f"Rate worker started (pid {self.health['pid']}), aggregating every {self.interval} seconds")
+        self.report_health()
+
+        try:
+            self.run(retention=not options['no_retention'])
+        finally:
+            if metrics_server is not None:
+                metrics_server.shutdown()
+            aggregation_runner.shutdown()
+            if self.retention_thread is not None and self.retention_thread.is_alive():
+                # Pruning deletes in batches, so the next run picks up where this one stops
+                logger.warning("Retention still running; it is interrupted and resumes on the next run.")
+            for api_name, _ in PROVIDERS:
+                get_client(api_name).close()
+            self.health["status"] = "stopped"
+            self.report_health()
+            logger.info("Rate worker stopped.")
+
+    def request_stop(self, signum, frame):
+        logger.info(f"Received signal {signum}; stopping after the current cycle.")
+        self.stopping.set()
+
+    def run(self, retention=True):
+        """
+        Ticks are scheduled on a fixed grid (start + n * interval) of the
+        monotonic clock, so cycle time does not accumulate as drift. A cycle
+        that overruns skips the ticks it missed instead of running them late.
+        Retention runs on its own thread, so a long prune never delays a tick.
+        """
+        next_retention = self.next_retention_time() if retention else None
+        start = time.monotonic()
+        tick = 0
+        while not self.stopping.is_set():
+            self.run_cycle()
+
+            if next_retention is not None and timezone.now() >= next_retention:
+                self.start_retention()
+                next_retention = self.next_retention_time()
+
+            tick += 1
+            due = int((time.monotonic() - start) // self.interval) + 1
+            if due > tick:
+                missed = due - tick
+                aggregation_runner.record_skipped(missed)
+                logger.warning(f"Aggregation cycle overran; skipped {missed} tick(s).")
+                tick = due
+            self.stopping.wait(max(start + tick * self.interval - time.monotonic(), 0))
+
+    def run_cycle(self):
+        # The lease interval follows --interval, not RATES_AGGREGATION_INTERVAL
+        future = aggregation_runner.submit(min_interval=lease_min_interval(self.interval))
+        if future is None:
+            return
+        success = future.result()
+        stats = aggregation_runner.stats()
+        now = timezone.now().isoformat()
+        self.health["cycles"] = stats["cycles"]
+        self.health["skipped_ticks"] = stats["skipped_ticks"]
+        self.health["last_cycle_at"] = now
+        self.health["last_cycle_seconds"] = round(stats["last_cycle_seconds"], 3)
+        if success:
+            self.health["last_success_at"] = now
+        else:
+            self.health["failures"] += 1
+        self.report_health()
+
+    def start_retention(self):
+        if self.retention_thread is not None and self.retention_thread.is_alive():
+            logger.warning("Previous retention run still in progress; skipping.")
+            return
+        self.retention_thread = threading.Thread(target=self.retention_job, name="rates-retention", daemon=True)
+        self.retention_thread.start()
+
+    def retention_job(self):
+        close_old_connections()
+        try:
+            run_retention()
+        finally:
+            close_old_connections()
+
+    def next_retention_time(self):
+        hour, minute = retention_time()
+        now = timezone.localtime()
+        at = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if at <= now:
+            at += timedelta(days=1)
+        return at
+
+    def report_health(self):
+        """Publish health to the cache (for other processes) and, if set, to the health file."""
+        self.health["updated_at"] = timezone.now().isoformat()
+        try:
+            cache.set(HEALTH_KEY, dict(self.health), timeout=max(int(self.interval * 3), 60))
+        except Exception as e:
+            logger.warning(f"Could not publish worker health: {e}")
+        if self.health_file:
+            tmp = f"{self.health_file}.tmp"
+            try:
+                with open(tmp, "w") as f:
+                    json.dump(self.health, f)
+                os.replace(tmp, self.health_file)
+            except OSError as e:
+                logger.warning(f"Could not write health file {self.health_file}: {e}")
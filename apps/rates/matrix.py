@@ -0,0 +1,143 @@
+"""
+In-process rate matrix for quotes.
+
+The matrix holds a rate for every ordered pair of currencies that the latest
+snapshot connects. It is built once per snapshot from the snapshot's
+LatestRate rows:
+
+    direct    the pair as stored, with its stored markup_rate
+    inverse   1 / rate of the stored reverse pair (GBP->USD from USD->GBP)
+    cross     through the other stored pairs (GBP->ZAR via USD)
+
+Derived markups apply settings.MARKUP_RATE to the derived average, like the
+aggregator does for stored pairs. A quote is then a dict lookup and a
+multiplication. The matrix is immutable: a new snapshot builds a new matrix,
+and the module-level reference is swapped in a single assignment, so a
+request always reads one consistent snapshot.
+"""
+import threading
+import time
+from collections import namedtuple, deque
+from decimal import ROUND_HALF_EVEN, Decimal, localcontext
+
+from django.conf import settings
+
+from .caching import get_snapshot
+from .crossrates import RATE_PRECISION, quantize_rate
+from .models import LatestRate
+
+AMOUNT_QUANTUM = Decimal("0.01")
+
+DIRECT = "direct"
+INVERSE = "inverse"
+CROSS = "cross"
+
+# fetched_at: the oldest stored rate the entry is derived from
+MatrixRate = namedtuple("MatrixRate", ["average_rate", "markup_rate", "fetched_at", "derivation"])
+
+
+def quantize_amount(value):
+    return value.quantize(AMOUNT_QUANTUM, rounding=ROUND_HALF_EVEN)
+
+
+class RateMatrix:
+    def __init__(self, version, fetched_at, rows):
+        """rows: (base, target, average_rate, markup_rate, fetched_at) tuples."""
+        self.version = version
+        self.fetched_at = fetched_at
+        self.rates = self._build(rows)
+
+    @staticmethod
+    def _build(rows):
+        markup = Decimal("1.0") + Decimal(str(settings.MARKUP_RATE))
+        direct = {}
+        graph = {}
+        for base, target, average_rate, markup_rate, fetched_at in rows:
+            if not average_rate:
+                continue
+            direct[(base, target)] = MatrixRate(average_rate, markup_rate, fetched_at, DIRECT)
+            graph.setdefault(base, []).append((target, average_rate, fetched_at))
+            graph.setdefault(target, []).append((base, 1 / average_rate, fetched_at))
+
+        rates = {}
+        seen = set()
+        with localcontext() as ctx:
+            ctx.prec = RATE_PRECISION
+            for root in graph:
+                if root in seen:
+                    continue
+                # Value of every connected currency in units of `root`, and the
+                # oldest rate on its path, found breadth-first
+                value = {root: Decimal(1)}
+                oldest = {root: None}
+                queue = deque([root])
+                seen.add(root)
+                while queue:
+                    currency = queue.popleft()
+                    for neighbour, rate, fetched_at in graph[currency]:
+                        if neighbour in value:
+                            continue
+                        value[neighbour] = value[currency] * rate
+                        path_oldest = oldest[currency]
+                        oldest[neighbour] = fetched_at if path_oldest is None else min(path_oldest, fetched_at)
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+
+                for base in value:
+                    for target in value:
+                        if base == target:
+                            continue
+                        if (base, target) in direct:
+                            rates[(base, target)] = direct[(base, target)]
+                            continue
+                        reverse = direct.get((target, base))
+                        if reverse is not None:
+                            average_rate, fetched_at, derivation = 1 / reverse.average_rate, reverse.fetched_at, INVERSE
+                        else:
+                            average_rate = value[target] / value[base]
+                            fetched_at = min(at for at in (oldest[base], oldest[target]) if at is not None)
+                            derivation = CROSS
+                        rates[(base, target)] = MatrixRate(
+                            quantize_rate(average_rate), quantize_rate(average_rate * markup), fetched_at, derivation
+                        )
+        return rates
+
+    def get(self, base, target):
+        return self.rates.get((base, target))
+
+
+def build_matrix(snapshot):
+    # Only the snapshot's own rows: an older LatestRate row must never win as `direct`
+    # over a fresh derived rate. Rows newer than a stale cached marker are still current.
+    rows = LatestRate.objects.filter(fetched_at__gte=snapshot["fetched_at"]).values_list(
+        'base_currency', 'target_currency', 'average_rate', 'markup_rate', 'fetched_at'
+    )
+    return RateMatrix(snapshot["version"], snapshot["fetched_at"], list(rows))
+
+
+_matrix = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_matrix():
+    """
+    The matrix of the latest snapshot, or None before the first snapshot.
+    The snapshot version is checked at most every
+    settings.RATES_MATRIX_CHECK_INTERVAL seconds; only a new version rebuilds.
+    """
+    global _matrix, _checked_at
+    matrix = _matrix
+    if matrix is not None and time.monotonic() - _checked_at < settings.RATES_MATRIX_CHECK_INTERVAL:
+        return matrix
+
+    with _lock:
+        if _matrix is not None and time.monotonic() - _checked_at < settings.RATES_MATRIX_CHECK_INTERVAL:
+            return _matrix
+        snapshot = get_snapshot()
+        if snapshot is None:
+            _matrix = None
+        elif _matrix is None or _matrix.version != snapshot["version"]:
+            _matrix = build_matrix(snapshot)
+        _checked_at = time.monotonic()
+        return _matrix
@@ -0,0 +1,267 @@
+"""
+Process-local metrics in the Prometheus text exposition format.
+
+Counters and histograms are updated where the work happens
+(services.py, auto_fetch.py, caching.py). Values that already live elsewhere
+(breaker state, snapshot age, HTTP client and auth statistics) are read at
+scrape time through callbacks. Each process exposes its own view: the web
+processes serve GET /api/metrics/, the rate worker serves
+`run_rate_worker --metrics-port`. Both require the METRICS_TOKEN bearer
+token and refuse every scrape while it is unset.
+"""
+import hmac
+import threading
+import time
+
+from django.conf import settings
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+
+def scrape_refusal(authorization):
+    """
+    HTTP status refusing a scrape with this Authorization header value, or
+    None to serve it: 403 while settings.METRICS_TOKEN is unset, 401 when
+    the header is not "Bearer <METRICS_TOKEN>".
+    """
+    if not settings.METRICS_TOKEN:
+        return 403
+    if not hmac.compare_digest(authorization, f"Bearer {settings.METRICS_TOKEN}"):
+        return 401
+    return None
+
+
+def escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(labels):
+    """Render ((name, value), ...) as {name="value",...}."""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """(suffix, labels, value) tuples."""
+        with self._lock:
+            return [("", key, value) for key, value in self._values.items()]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0  # export 0 before the first increment
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        samples = []
+        for key, counts, total in items:
+            for bound, count in zip(self.buckets, counts):
+                samples.append(("_bucket", key + (("le", format_value(float(bound))),), count))
+            samples.append(("_count", key, counts[-1]))
+            samples.append(("_sum", key, total))
+        return samples
+
+
+class CallbackMetric(Metric):
+    """
+    A metric whose samples come from `collect()` at scrape time, as a list
+    of ({label: value}, value).
+    """
+
+    def __init__(self, name, documentation, type, collect):
+        super().__init__(name, documentation)
+        self.type = type
+        self.collect = collect
+
+    def samples(self):
+        return [("", tuple(labels.items()), value) for labels, value in self.collect()]
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                # One failing callback must not take the whole scrape down
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+
+# Provider fetches
+PROVIDER_FETCH_SECONDS = REGISTRY.register(Histogram(
+    "rates_provider_fetch_seconds", "Time to fetch one provider, retries included.", ["provider"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20),
+))
+PROVIDER_FETCHES = REGISTRY.register(Counter(
+    "rates_provider_fetches_total",
+    "Provider fetch outcomes per cycle: success, failure, timeout, cached, breaker_open, quota_exhausted.",
+    ["provider", "outcome"],
+))
+PROVIDER_RETRIES = REGISTRY.register(Counter(
+    "rates_provider_retries_total", "Provider call attempts after the first.", ["provider"],
+))
+
+# Aggregation cycles
+CYCLE_SECONDS = REGISTRY.register(Histogram(
+    "rates_aggregation_cycle_seconds", "Duration of aggregation cycles.",
+))
+CYCLES = REGISTRY.register(Counter(
+    "rates_aggregation_cycles_total", "Aggregation cycles by result (stored, not_stored).", ["result"],
+))
+SKIPPED_TICKS = REGISTRY.register(Counter(
+    "rates_aggregation_skipped_ticks_total", "Scheduler ticks skipped because a cycle was still running.",
+))
+ROWS_WRITTEN = REGISTRY.register(Counter(
+    "rates_rows_written_total", "AggregatedRate rows written.",
+))
+
+# Read endpoints
+RESPONSE_CACHE = REGISTRY.register(Counter(
+    "rates_response_cache_total", "Rate endpoint response cache lookups by result (hit, miss, not_modified).",
+    ["result"],
+))
+
+
+def _breaker_states():
+    from .breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+    from .services import PROVIDERS
+
+    codes = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+    return [({"provider": name}, codes[CircuitBreaker(name).state]) for name, _ in PROVIDERS]
+
+
+def _snapshot_age():
+    from .caching import get_snapshot
+
+    snapshot = get_snapshot()
+    if snapshot is None:
+        return []
+    return [({}, round(time.time() - snapshot["fetched_at"].timestamp(), 3))]
+
+
+def _client_stat(field):
+    def collect():
+        from .clients import client_metrics
+
+        return [({"provider": name}, stats[field]) for name, stats in client_metrics().items()]
+    return collect
+
+
+def _auth_stat(field):
+    def collect():
+        from apps.users.authentication import auth_stats
+
+        return [({}, auth_stats.snapshot()[field])]
+    return collect
+
+
+REGISTRY.register(CallbackMetric(
+    "rates_provider_breaker_state", "Provider circuit breaker state: 0 closed, 1 half-open, 2 open.",
+    "gauge", _breaker_states,
+))
+REGISTRY.register(CallbackMetric(
+    "rates_snapshot_age_seconds", "Seconds since the latest committed snapshot was fetched.",
+    "gauge", _snapshot_age,
+))
+REGISTRY.register(CallbackMetric(
+    "rates_http_requests_total", "Requests sent to providers by this process.",
+    "counter", _client_stat("requests"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_http_connections_opened_total", "Provider connections opened by this process.",
+    "counter", _client_stat("connections_opened"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_auth_requests_total", "JWT authentications (cookie or Bearer header) that succeeded.",
+    "counter", _auth_stat("authenticated"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_auth_failures_total", "JWT authentications (cookie or Bearer header) that failed.",
+    "counter", _auth_stat("failed"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_auth_token_cache_hits_total", "Access tokens served from the validated-token cache.",
+    "counter", _auth_stat("token_cache_hits"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_auth_token_cache_misses_total", "Access tokens that had to be decoded and verified.",
+    "counter", _auth_stat("token_cache_misses"),
+))
+REGISTRY.register(CallbackMetric(
+    "rates_auth_seconds_total", "Total time spent authenticating requests.",
+    "counter", _auth_stat("seconds_total"),
+))
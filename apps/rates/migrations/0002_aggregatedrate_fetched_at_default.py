@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aggregatedrate',
+            name='fetched_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:07
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """
+    CREATE INDEX CONCURRENTLY on PostgreSQL, so building the indexes does not
+    block the aggregator's inserts; a plain CREATE INDEX on other databases.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('rates', '0002_aggregatedrate_fetched_at_default'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='aggregatedrate',
+            index=models.Index(fields=['base_currency', 'target_currency', '-fetched_at'], name='rates_pair_fetched_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='aggregatedrate',
+            index=models.Index(fields=['target_currency', '-fetched_at'], name='rates_target_fetched_idx'),
+        ),
+        AddIndexConcurrentlyOnPostgres(
+            model_name='aggregatedrate',
+            index=models.Index(fields=['fetched_at'], name='rates_fetched_idx'),
+        ),
+    ]
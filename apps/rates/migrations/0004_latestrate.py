@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest_rates(apps, schema_editor):
+    AggregatedRate = apps.get_model('rates', 'AggregatedRate')
+    LatestRate = apps.get_model('rates', 'LatestRate')
+    pairs = AggregatedRate.objects.values_list('base_currency', 'target_currency').distinct()
+    for base, target in pairs:
+        rate = AggregatedRate.objects.filter(
+            base_currency=base, target_currency=target
+        ).order_by('-fetched_at', '-id').first()
+        LatestRate.objects.create(
+            base_currency=base,
+            target_currency=target,
+            rate=rate,
+            average_rate=rate.average_rate,
+            markup_rate=rate.markup_rate,
+            fetched_at=rate.fetched_at,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0003_aggregatedrate_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_currency', models.CharField(max_length=3)),
+                ('target_currency', models.CharField(max_length=3)),
+                ('average_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('markup_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('fetched_at', models.DateTimeField()),
+                ('rate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='rates.aggregatedrate')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'target_currency'), name='rates_latest_pair_uniq')],
+            },
+        ),
+        migrations.RunPython(backfill_latest_rates, migrations.RunPython.noop),
+    ]
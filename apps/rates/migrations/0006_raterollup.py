@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0005_schedulerlease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RateRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_currency', models.CharField(max_length=3)),
+                ('target_currency', models.CharField(max_length=3)),
+                ('bucket', models.CharField(choices=[('1m', '1 minute'), ('5m', '5 minutes'), ('1h', '1 hour'), ('1d', '1 day')], max_length=3)),
+                ('bucket_start', models.DateTimeField()),
+                ('open_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('high_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('low_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('close_rate', models.DecimalField(decimal_places=6, max_digits=12)),
+                ('rate_sum', models.DecimalField(decimal_places=6, max_digits=20)),
+                ('sample_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'target_currency', 'bucket', 'bucket_start'), name='rates_rollup_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:14
+
+from django.db import migrations, models
+
+# Pairs the aggregator used to hardcode
+DEFAULT_PAIRS = [('USD', 'GBP'), ('USD', 'ZAR'), ('ZAR', 'GBP')]
+
+
+def seed_default_pairs(apps, schema_editor):
+    CurrencyPair = apps.get_model('rates', 'CurrencyPair')
+    for base, target in DEFAULT_PAIRS:
+        CurrencyPair.objects.get_or_create(base_currency=base, target_currency=target)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0006_raterollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyPair',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('base_currency', models.CharField(max_length=3)),
+                ('target_currency', models.CharField(max_length=3)),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('base_currency', 'target_currency'), name='rates_pair_uniq')],
+            },
+        ),
+        migrations.RunPython(seed_default_pairs, migrations.RunPython.noop),
+    ]
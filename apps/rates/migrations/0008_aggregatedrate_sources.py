@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 16:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0007_currencypair'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aggregatedrate',
+            name='sources',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rates', '0008_aggregatedrate_sources'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='aggregatedrate',
+            name='average_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='aggregatedrate',
+            name='markup_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='latestrate',
+            name='average_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='latestrate',
+            name='markup_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='raterollup',
+            name='close_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='raterollup',
+            name='high_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='raterollup',
+            name='low_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='raterollup',
+            name='open_rate',
+            field=models.DecimalField(decimal_places=10, max_digits=20),
+        ),
+        migrations.AlterField(
+            model_name='raterollup',
+            name='rate_sum',
+            field=models.DecimalField(decimal_places=10, max_digits=28),
+        ),
+    ]
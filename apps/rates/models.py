@@ -1,11 +1,131 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
 class AggregatedRate(models.Model):
     base_currency = models.CharField(max_length=3)
     target_currency = models.CharField(max_length=3)
-    average_rate = models.DecimalField(max_digits=12, decimal_places=6)
-    markup_rate = models.DecimalField(max_digits=12, decimal_places=6)
-    fetched_at = models.DateTimeField(auto_now_add=True)
+    # Ten decimal places keep small rates (VND->USD is ~0.00004) precise to 1e-6 relative
+    average_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    markup_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    # Set explicitly by the aggregator so every row of a snapshot shares one timestamp
+    fetched_at = models.DateTimeField(default=timezone.now)
+    # Per-provider quotes behind this rate: [{"provider", "rate", "used", "reason"}]
+    sources = models.JSONField(default=list, blank=True)
+
+    class Meta:
+        indexes = [
+            # Pair / base-currency lookups, newest first
+            models.Index(fields=['base_currency', 'target_currency', '-fetched_at'], name='rates_pair_fetched_idx'),
+            # Target-currency side of the "base or target" filters
+            models.Index(fields=['target_currency', '-fetched_at'], name='rates_target_fetched_idx'),
+            # Snapshot lookups and unfiltered history ordering
+            models.Index(fields=['fetched_at'], name='rates_fetched_idx'),
+        ]
 
     def __str__(self):
         return f"{self.base_currency}->{self.target_currency}: {self.average_rate}"
+
+
+class CurrencyPair(models.Model):
+    """
+    Whitelist of pairs the aggregator computes and stores each cycle.
+    Both currencies must be in settings.RATES_CURRENCIES.
+    """
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'target_currency'], name='rates_pair_uniq'),
+        ]
+
+    def clean(self):
+        self.base_currency = self.base_currency.upper()
+        self.target_currency = self.target_currency.upper()
+        errors = {
+            field: f"'{getattr(self, field)}' is not in RATES_CURRENCIES ({', '.join(settings.RATES_CURRENCIES)})."
+            for field in ('base_currency', 'target_currency')
+            if getattr(self, field) not in settings.RATES_CURRENCIES
+        }
+        if errors:
+            raise ValidationError(errors)
+        if self.base_currency == self.target_currency:
+            raise ValidationError("Base and target currency must differ.")
+
+    def __str__(self):
+        return f"{self.base_currency}->{self.target_currency}"
+
+
+class LatestRate(models.Model):
+    """
+    Most recent AggregatedRate per currency pair, upserted by the aggregator
+    so latest-rate reads are a single small lookup.
+    """
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    rate = models.ForeignKey(AggregatedRate, on_delete=models.CASCADE, related_name='+')
+    average_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    markup_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['base_currency', 'target_currency'], name='rates_latest_pair_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency}->{self.target_currency}: {self.average_rate} (latest)"
+
+
+class RateRollup(models.Model):
+    """
+    Open/high/low/close summary of average_rate per pair and time bucket,
+    folded in by the aggregator as each snapshot is written.
+    """
+    BUCKET_CHOICES = [
+        ('1m', '1 minute'),
+        ('5m', '5 minutes'),
+        ('1h', '1 hour'),
+        ('1d', '1 day'),
+    ]
+
+    base_currency = models.CharField(max_length=3)
+    target_currency = models.CharField(max_length=3)
+    bucket = models.CharField(max_length=3, choices=BUCKET_CHOICES)
+    bucket_start = models.DateTimeField()
+    open_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    high_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    low_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    close_rate = models.DecimalField(max_digits=20, decimal_places=10)
+    rate_sum = models.DecimalField(max_digits=28, decimal_places=10)
+    sample_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Also serves the pair + bucket + time-range reads of the OHLC endpoint
+            models.UniqueConstraint(
+                fields=['base_currency', 'target_currency', 'bucket', 'bucket_start'],
+                name='rates_rollup_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.base_currency}->{self.target_currency} {self.bucket} @ {self.bucket_start}"
+
+
+class SchedulerLease(models.Model):
+    """
+    Cross-process lease for a scheduled job. `token` is incremented on every
+    acquisition and fences out writes from a holder whose lease has expired.
+    """
+    name = models.CharField(max_length=64, unique=True)
+    owner = models.CharField(max_length=128, blank=True)
+    token = models.PositiveBigIntegerField(default=0)
+    expires_at = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name} (token {self.token}, owner {self.owner or '-'})"
@@ -0,0 +1,153 @@
+"""
+Keyset (cursor) pagination for the rate list endpoints.
+
+Pages are ordered newest first on (fetched_at, id) and each page is fetched
+with a WHERE on the last seen key, so page 1000 costs the same as page 1.
+Cursors are opaque to clients; the total count is only computed on request.
+"""
+import base64
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.urls import replace_query_param
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+def encode_cursor(direction, fetched_at, pk):
+    raw = f"{direction}|{fetched_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, fetched_at, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+        if direction not in (NEXT, PREVIOUS):
+            raise ValueError(direction)
+        return direction, datetime.fromisoformat(fetched_at), int(pk)
+    except (ValueError, UnicodeDecodeError):
+        raise ParseError("Invalid cursor.")
+
+
+class KeysetPaginator:
+    """
+    Paginates a queryset of AggregatedRate-like rows by (fetched_at, id).
+    Query params:
+        ?cursor=<opaque>       from a previous response's next/previous link
+        ?page_size=N           defaults to settings.RATES_PAGE_SIZE
+        ?count=exact|estimate  include a total count (omitted by default)
+    """
+    cursor_param = 'cursor'
+
+    def __init__(self, request):
+        self.request = request
+        self.page_size = self._get_page_size()
+        cursor = request.GET.get(self.cursor_param)
+        self.cursor = decode_cursor(cursor) if cursor else None
+        self.count_mode = request.GET.get('count')
+        if self.count_mode not in (None, 'exact', 'estimate'):
+            raise ParseError("count must be 'exact' or 'estimate'.")
+
+    def _get_page_size(self):
+        page_size = self.request.GET.get('page_size')
+        if page_size is None:
+            return settings.RATES_PAGE_SIZE
+        try:
+            page_size = int(page_size)
+        except ValueError:
+            raise ParseError("page_size must be an integer.")
+        if page_size < 1:
+            raise ParseError("page_size must be positive.")
+        return min(page_size, settings.RATES_MAX_PAGE_SIZE)
+
+    @property
+    def is_first_page(self):
+        return self.cursor is None
+
+    @property
+    def is_backwards(self):
+        return self.cursor is not None and self.cursor[0] == PREVIOUS
+
+    def page_queryset(self, queryset):
+        """
+        Restrict and order `queryset` to the requested page. One extra row is
+        fetched so build_page() can tell whether another page follows.
+        """
+        if self.cursor is None:
+            return queryset.order_by('-fetched_at', '-id')[:self.page_size + 1]
+
+        direction, fetched_at, pk = self.cursor
+        if direction == NEXT:
+            queryset = queryset.filter(Q(fetched_at__lt=fetched_at) | Q(fetched_at=fetched_at, id__lt=pk))
+            return queryset.order_by('-fetched_at', '-id')[:self.page_size + 1]
+
+        queryset = queryset.filter(Q(fetched_at__gt=fetched_at) | Q(fetched_at=fetched_at, id__gt=pk))
+        return queryset.order_by('fetched_at', 'id')[:self.page_size + 1]
+
+    def build_page(self, rows):
+        """
+        Trim the extra row from a page_queryset() result.
+        Returns:
+            rows (newest first), next_cursor, previous_cursor
+        """
+        rows = list(rows)
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.is_backwards:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            first, last = rows[0], rows[-1]
+            if has_more or self.is_backwards:
+                next_cursor = encode_cursor(NEXT, last.fetched_at, last.id)
+            if (has_more and self.is_backwards) or (self.cursor is not None and not self.is_backwards):
+                previous_cursor = encode_cursor(PREVIOUS, first.fetched_at, first.id)
+        return rows, next_cursor, previous_cursor
+
+    def get_count(self, queryset):
+        if self.count_mode == 'exact':
+            return queryset.count()
+        if self.count_mode == 'estimate':
+            return estimate_count(queryset)
+        return None
+
+    async def aget_count(self, queryset):
+        if self.count_mode == 'exact':
+            return await queryset.acount()
+        if self.count_mode == 'estimate':
+            return await sync_to_async(estimate_count)(queryset)
+        return None
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_param, cursor)
+
+    def get_response_data(self, queryset, results, next_cursor, previous_cursor):
+        return {
+            "count": self.get_count(queryset),
+            "next": self.get_link(next_cursor),
+            "previous": self.get_link(previous_cursor),
+            "results": results,
+        }
+
+
+def estimate_count(queryset):
+    """
+    Planner row estimate on PostgreSQL (no table scan); exact count elsewhere.
+    """
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    plan = json.loads(queryset.order_by().explain(format='json'))
+    if isinstance(plan, list):
+        plan = plan[0]
+    return int(plan['Plan']['Plan Rows'])
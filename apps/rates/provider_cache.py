@@ -0,0 +1,144 @@
+"""
+Provider-side cache and monthly quota ledger.
+
+Each provider's last quote is kept in the Django cache along with the ETag /
+Last-Modified validators of the response it came from. An aggregation cycle
+reuses that quote instead of calling the provider while it is younger than
+the provider's refetch interval:
+
+    interval = max(RATES_PROVIDER_MIN_INTERVAL[provider],
+                   seconds left in the month / calls left in the monthly quota)
+
+so polling spreads whatever budget remains evenly over the rest of the month.
+Every outbound request, retries included, is counted in the ledger. The
+ledger only bounds the whole deployment when the cache is shared between
+processes (see caching.require_shared_cache).
+"""
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+
+LEDGER_TIMEOUT = 32 * 24 * 60 * 60  # a month's ledger outlives the month
+
+
+def month_end(now):
+    """Start of the next UTC month, as epoch seconds."""
+    start = datetime.fromtimestamp(now, tz=dt_timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1).timestamp()
+    return start.replace(month=start.month + 1).timestamp()
+
+
+class ProviderCache:
+    """
+    Cached quote, conditional-request validators and quota ledger for one
+    provider. Instances are cheap; all state lives in the Django cache.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        slug = name.lower().replace(" ", "_")
+        self.key = f"rates:provider:{slug}"
+        self.ledger_prefix = f"rates:quota:{slug}"
+        # Validators of the response being processed, saved by store()
+        self.validators = {}
+
+    def load(self):
+        """Cached entry: {"quote", "fetched_at", "etag", "last_modified"}, or None."""
+        return cache.get(self.key)
+
+    def fresh_quote(self):
+        """
+        The cached quote if it is still within the refetch interval.
+        Returns:
+            (quote, age in seconds) or None
+        """
+        entry = self.load()
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        if age >= self.refetch_interval():
+            return None
+        return entry["quote"], age
+
+    def conditional_headers(self):
+        """If-None-Match / If-Modified-Since for the cached response, if any."""
+        entry = self.load()
+        if entry is None:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def remember_validators(self, response_headers):
+        self.validators = {
+            "etag": response_headers.get("ETag"),
+            "last_modified": response_headers.get("Last-Modified"),
+        }
+
+    def store(self, quote):
+        """Cache a freshly parsed quote. Returns the quote as stored."""
+        now = time.time()
+        if quote.quoted_at is None:
+            # Keep the staleness check meaningful when the quote is reused later
+            quote = quote._replace(quoted_at=datetime.fromtimestamp(now, tz=dt_timezone.utc))
+        cache.set(self.key, {"quote": quote, "fetched_at": now, **self.validators}, timeout=None)
+        return quote
+
+    def touch(self):
+        """
+        The provider answered 304 Not Modified: the cached quote is current
+        again. Returns the cached quote, or None if it has been evicted.
+        """
+        entry = self.load()
+        if entry is None:
+            return None
+        entry["fetched_at"] = time.time()
+        cache.set(self.key, entry, timeout=None)
+        return entry["quote"]
+
+    # Quota ledger
+
+    def _ledger_key(self, now):
+        month = datetime.fromtimestamp(now, tz=dt_timezone.utc)
+        return f"{self.ledger_prefix}:{month:%Y-%m}"
+
+    def record_call(self):
+        key = self._ledger_key(time.time())
+        cache.add(key, 0, timeout=LEDGER_TIMEOUT)
+        try:
+            return cache.incr(key)
+        except ValueError:
+            # Evicted between add() and incr()
+            cache.set(key, 1, timeout=LEDGER_TIMEOUT)
+            return 1
+
+    def calls_this_month(self):
+        return cache.get(self._ledger_key(time.time()), 0)
+
+    @property
+    def monthly_quota(self):
+        return settings.RATES_PROVIDER_MONTHLY_QUOTA.get(self.name)
+
+    def quota_exhausted(self):
+        quota = self.monthly_quota
+        return quota is not None and self.calls_this_month() >= quota
+
+    def refetch_interval(self):
+        """Minimum seconds between calls, stretched to fit the remaining monthly quota."""
+        interval = settings.RATES_PROVIDER_MIN_INTERVAL.get(self.name, 0)
+        quota = self.monthly_quota
+        if quota is None:
+            return interval
+
+        now = time.time()
+        left_in_month = month_end(now) - now
+        remaining_calls = quota - self.calls_this_month()
+        if remaining_calls <= 0:
+            return left_in_month
+        return max(interval, left_in_month / remaining_calls)
@@ -0,0 +1,54 @@
+import json
+
+from rest_framework.negotiation import BaseContentNegotiation
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional speed-up, falls back to the stdlib encoder
+    orjson = None
+
+
+def json_bytes(obj):
+    """
+    Compact UTF-8 JSON, encoded by orjson when it is installed and by the
+    stdlib otherwise. Raises TypeError for types the encoder can't handle.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+    Indented (browsable/debug) output still goes through the stdlib encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return json_bytes(data)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+
+class FirstRendererNegotiation(BaseContentNegotiation):
+    """
+    Always pick the view's first renderer, whatever the Accept header says.
+    For views that choose their own response format (the URL picks it) and
+    only render error responses through DRF.
+    """
+
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def ignore_accept(func):
+    """Function-view counterpart of `content_negotiation_class = FirstRendererNegotiation`."""
+    func.content_negotiation_class = FirstRendererNegotiation
+    return func
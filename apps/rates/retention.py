@@ -0,0 +1,89 @@
+"""
+Retention for rate history.
+
+Raw AggregatedRate rows are kept for RATES_RAW_RETENTION_DAYS; before they
+are removed, their days are compacted into RateRollup so charts keep
+working. Rollups have their own per-bucket retention. Deletes run in small
+batches, each in its own short transaction, so they never hold long locks
+against the aggregator or readers.
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.timezone import localtime
+
+from .models import AggregatedRate, LatestRate, RateRollup
+from .rollups import rebuild_rollups_for_day
+
+logger = logging.getLogger("forex_scheduler")
+
+
+def delete_in_batches(queryset, batch_size, pause=0):
+    """Delete rows matching `queryset` `batch_size` at a time. Returns the count."""
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            model.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        if pause:
+            time.sleep(pause)
+
+
+def compact_raw_rates(cutoff):
+    """
+    Build rollups for days before `cutoff` that have raw rows but no rollups
+    yet (history from before rollups were maintained). Returns days compacted.
+    """
+    oldest = AggregatedRate.objects.order_by('fetched_at').values_list('fetched_at', flat=True).first()
+    if oldest is None or oldest >= cutoff:
+        return 0
+
+    compacted = 0
+    day = localtime(oldest).date()
+    last_day = localtime(cutoff).date()
+    while day <= last_day:
+        day_start = timezone.make_aware(datetime.combine(day, dt_time.min))
+        if not RateRollup.objects.filter(bucket='1d', bucket_start=day_start).exists():
+            if rebuild_rollups_for_day(day):
+                compacted += 1
+        day += timedelta(days=1)
+    return compacted
+
+
+def prune_rates(raw_days=None, batch_size=None, compact=True, pause=0):
+    """
+    Apply the retention policy. Returns a dict of rows deleted per table
+    ("raw" and one entry per rollup bucket) plus days compacted.
+    The LatestRate rows' source rates are never deleted.
+    """
+    if raw_days is None:
+        raw_days = settings.RATES_RAW_RETENTION_DAYS
+    if batch_size is None:
+        batch_size = settings.RATES_RETENTION_BATCH_SIZE
+    now = timezone.now()
+    result = {}
+
+    cutoff = now - timedelta(days=raw_days)
+    result["compacted_days"] = compact_raw_rates(cutoff) if compact else 0
+    raw = AggregatedRate.objects.filter(fetched_at__lt=cutoff).exclude(
+        id__in=LatestRate.objects.values('rate_id')
+    )
+    result["raw"] = delete_in_batches(raw, batch_size, pause)
+
+    for bucket, days in settings.RATES_ROLLUP_RETENTION_DAYS.items():
+        if days is None:
+            continue
+        rollups = RateRollup.objects.filter(bucket=bucket, bucket_start__lt=now - timedelta(days=days))
+        result[bucket] = delete_in_batches(rollups, batch_size, pause)
+
+    logger.info(f"Retention pruned rates: {result}")
+    return result
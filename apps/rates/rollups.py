@@ -0,0 +1,162 @@
+"""
+Time-bucketed OHLC rollups of AggregatedRate.
+
+Every snapshot is folded into the 1m/5m/1h/1d buckets as it is written, so
+charts over long ranges read a few hundred RateRollup rows instead of
+rescanning raw history. Buckets are aligned in the current timezone (CAT),
+so a 1d bucket is a local calendar day. rebuild_rollups() recomputes them
+from raw rows, day by day, for backfills and compaction. Days older than
+RATES_RAW_RETENTION_DAYS are refused: retention has deleted (some of) their
+raw rows, and the rollups are all that is left of them.
+"""
+from datetime import datetime, time, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.timezone import localtime
+
+from .models import AggregatedRate, RateRollup
+
+BUCKETS = [bucket for bucket, _ in RateRollup.BUCKET_CHOICES]
+
+
+def bucket_start(fetched_at, bucket):
+    local = localtime(fetched_at).replace(second=0, microsecond=0)
+    if bucket == '1m':
+        return local
+    if bucket == '5m':
+        return local.replace(minute=local.minute - local.minute % 5)
+    if bucket == '1h':
+        return local.replace(minute=0)
+    if bucket == '1d':
+        return local.replace(hour=0, minute=0)
+    raise ValueError(f"Unknown bucket '{bucket}'")
+
+
+def new_rollup(base, target, bucket, start, rate):
+    return RateRollup(
+        base_currency=base,
+        target_currency=target,
+        bucket=bucket,
+        bucket_start=start,
+        open_rate=rate,
+        high_rate=rate,
+        low_rate=rate,
+        close_rate=rate,
+        rate_sum=rate,
+        sample_count=1,
+    )
+
+
+def fold(rollup, rate):
+    """Add a later sample `rate` to `rollup`."""
+    rollup.high_rate = max(rollup.high_rate, rate)
+    rollup.low_rate = min(rollup.low_rate, rate)
+    rollup.close_rate = rate
+    rollup.rate_sum += rate
+    rollup.sample_count += 1
+
+
+def update_rollups(rows):
+    """
+    Fold one snapshot's AggregatedRate rows into every bucket. Runs inside
+    the snapshot transaction: one locked SELECT, then a bulk update and a
+    bulk insert.
+    """
+    if not rows:
+        return
+
+    samples = {}
+    for row in rows:
+        for bucket in BUCKETS:
+            key = (row.base_currency, row.target_currency, bucket, bucket_start(row.fetched_at, bucket))
+            samples[key] = row.average_rate
+
+    existing = {
+        (r.base_currency, r.target_currency, r.bucket, r.bucket_start): r
+        for r in RateRollup.objects.select_for_update().filter(
+            bucket_start__in={key[3] for key in samples},
+            base_currency__in={key[0] for key in samples},
+            target_currency__in={key[1] for key in samples},
+        )
+    }
+
+    to_update, to_create = [], []
+    for key, rate in samples.items():
+        rollup = existing.get(key)
+        if rollup is None:
+            to_create.append(new_rollup(*key, rate))
+        else:
+            fold(rollup, rate)
+            to_update.append(rollup)
+
+    if to_update:
+        RateRollup.objects.bulk_update(
+            to_update, ['high_rate', 'low_rate', 'close_rate', 'rate_sum', 'sample_count']
+        )
+    if to_create:
+        RateRollup.objects.bulk_create(to_create)
+
+
+def earliest_rebuildable_day():
+    """
+    First local date whose raw rows are all still inside the
+    RATES_RAW_RETENTION_DAYS window.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.RATES_RAW_RETENTION_DAYS)
+    return localtime(cutoff).date() + timedelta(days=1)
+
+
+def rebuild_rollups_for_day(day):
+    """
+    Recompute the rollups of local calendar date `day` from raw rows. Only
+    the buckets of pairs that have raw rows that day are replaced.
+    Returns the number of raw rows read.
+    """
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(day, time.min), tz)
+    end = start + timedelta(days=1)
+
+    rollups = {}
+    count = 0
+    rows = AggregatedRate.objects.filter(fetched_at__gte=start, fetched_at__lt=end).order_by(
+        'fetched_at', 'id'
+    ).values_list('base_currency', 'target_currency', 'average_rate', 'fetched_at')
+    for base, target, rate, fetched_at in rows.iterator(chunk_size=2000):
+        count += 1
+        for bucket in BUCKETS:
+            key = (base, target, bucket, bucket_start(fetched_at, bucket))
+            rollup = rollups.get(key)
+            if rollup is None:
+                rollups[key] = new_rollup(*key, rate)
+            else:
+                fold(rollup, rate)
+
+    pairs = {(base, target) for base, target, _, _ in rollups}
+    with transaction.atomic():
+        for base, target in pairs:
+            RateRollup.objects.filter(
+                base_currency=base, target_currency=target, bucket_start__gte=start, bucket_start__lt=end
+            ).delete()
+        RateRollup.objects.bulk_create(rollups.values(), batch_size=1000)
+    return count
+
+
+def rebuild_rollups(start_day, end_day):
+    """
+    Rebuild rollups for every local date from start_day to end_day inclusive.
+    Raises ValueError if start_day is before earliest_rebuildable_day().
+    """
+    earliest = earliest_rebuildable_day()
+    if start_day < earliest:
+        raise ValueError(
+            f"Raw rates before {earliest} are past RATES_RAW_RETENTION_DAYS; "
+            f"their rollups cannot be rebuilt"
+        )
+    count = 0
+    day = start_day
+    while day <= end_day:
+        count += rebuild_rollups_for_day(day)
+        day += timedelta(days=1)
+    return count
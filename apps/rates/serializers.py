@@ -4,4 +4,4 @@ from .models import AggregatedRate
 class AggregatedRateSerializer(serializers.ModelSerializer):
     class Meta:
         model = AggregatedRate
-        fields = '__all__'
+        fields = ['id', 'base_currency', 'target_currency', 'average_rate', 'markup_rate', 'fetched_at']
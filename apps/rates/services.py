@@ -1,9 +1,22 @@
-import requests
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
 from decimal import Decimal
 from django.conf import settings
+from django.db import connection, transaction
 from django.utils import timezone
-from .models import AggregatedRate
-from django.core.cache import cache
+from django.utils.dateparse import parse_datetime
+from .breaker import CircuitBreaker
+from .caching import publish_snapshot
+from .clients import ProviderHTTPError, get_client
+from .consensus import aggregate_quotes
+from .crossrates import cross_rates, quantize_rate, quote_vector
+from .locks import LeaseLost, acquire_lease
+from .metrics import PROVIDER_FETCH_SECONDS, PROVIDER_FETCHES, PROVIDER_RETRIES, ROWS_WRITTEN
+from .models import AggregatedRate, CurrencyPair, LatestRate
+from .provider_cache import ProviderCache
+from .rollups import update_rollups
+from concurrent.futures import ThreadPoolExecutor, wait
+import random
 import time
 import logging
 
@@ -14,122 +27,387 @@ CURRENCYFREAKS_URL = "https://api.currencyfreaks.com/v2.0/rates/latest"
 FASTFOREX_URL = "https://api.fastforex.io/fetch-all"
 APILAYER_URL = "https://api.apilayer.com/exchangerates_data/latest"
 
+AGGREGATION_LEASE = "aggregate_rates"
+# Share of the aggregation interval that must pass between two cycles, so
+# workers ticking a little early still get their turn
+LEASE_INTERVAL_SLACK = 0.9
+
+# rates: quote vector (see crossrates.py); quoted_at: provider's own timestamp, if any
+ProviderQuote = namedtuple("ProviderQuote", ["rates", "quoted_at"])
+
 MAX_RETRIES = 3
-RETRY_DELAY = 2  # seconds
+RETRY_DELAY = 2  # seconds, doubled after every failed attempt
+RETRY_MAX_DELAY = 10  # seconds
+
+
+def is_permanent_error(error):
+    """Revoked keys and exhausted quotas won't recover by retrying."""
+    return "no longer active" in str(error) or "exceeded" in str(error)
+
 
+def backoff_delay(attempt):
+    """Exponential backoff with jitter: half the capped delay fixed, half random."""
+    delay = min(RETRY_DELAY * 2 ** (attempt - 1), RETRY_MAX_DELAY)
+    return delay / 2 + random.uniform(0, delay / 2)
 
-def fetch_with_retry(func, *args, **kwargs):
-    """Retry wrapper for API calls"""
+
+def fetch_with_retry(func, *args, deadline=None, breaker=None, **kwargs):
+    """
+    Retry wrapper for API calls with exponential backoff and jitter.
+    A Retry-After / rate-limit reset from the provider replaces the backoff.
+    `deadline` is a time.monotonic() value; no new attempt is started past it.
+    The final outcome is reported to `breaker`, if given.
+    """
+    provider = breaker.name if breaker is not None else func.__name__
     for attempt in range(1, MAX_RETRIES + 1):
+        if attempt > 1:
+            PROVIDER_RETRIES.inc(provider=provider)
+        # Only the failure that sent it is governed by a Retry-After
+        retry_after = None
         try:
-            return func(*args, **kwargs)
+            result = func(*args, **kwargs)
+            if breaker is not None:
+                breaker.record_success()
+            return result
         except ValueError as e:
             # Permanent failures: skip retries
-            if "no longer active" in str(e) or "exceeded" in str(e):
+            if is_permanent_error(e):
+                if breaker is not None:
+                    breaker.record_failure(permanent=True)
                 raise
             logger.warning(f"Attempt {attempt} failed for {func.__name__}: {e}")
+        except ProviderHTTPError as e:
+            retry_after = e.retry_after
+            logger.warning(f"Attempt {attempt} failed for {func.__name__}: {e}")
         except Exception as e:
             logger.warning(f"Attempt {attempt} failed for {func.__name__}: {e}")
 
         if attempt < MAX_RETRIES:
-            time.sleep(RETRY_DELAY)
-    raise Exception(f"{func.__name__} failed after {MAX_RETRIES} attempts")
+            delay = retry_after if retry_after is not None else backoff_delay(attempt)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                break
+            time.sleep(delay)
+
+    if breaker is not None:
+        breaker.record_failure(retry_after=retry_after)
+    raise Exception(f"{func.__name__} failed after {attempt} attempts")
+
+
+def parse_quote_time(value):
+    """Provider timestamp (epoch seconds or ISO-like string, UTC if naive) as an aware datetime."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+    parsed = parse_datetime(str(value))
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed
+
+
+def get_provider_json(api_name, provider_cache, url, **kwargs):
+    """
+    Conditional GET through the provider's shared client; the call is
+    counted in the provider's quota ledger.
+    Returns:
+        the JSON body, or None if the provider answered 304 Not Modified
+    """
+    kwargs["headers"] = {**kwargs.get("headers", {}), **provider_cache.conditional_headers()}
+    provider_cache.record_call()
+    r = get_client(api_name).get(url, **kwargs)
+    if r.status_code == 304:
+        return None
+    provider_cache.remember_validators(r.headers)
+    return r.json()
 
 
-def fetch_rates_from_currencyfreaks():
-    r = requests.get(
-        CURRENCYFREAKS_URL,
-        params={"apikey": settings.CURRENCYFREAKS_KEY, "symbols": "USD,GBP,ZAR"},
-        timeout=10
+def fetch_rates_from_currencyfreaks(provider_cache):
+    currencies = settings.RATES_CURRENCIES
+    data = get_provider_json(
+        "CurrencyFreaks", provider_cache, CURRENCYFREAKS_URL,
+        params={"apikey": settings.CURRENCYFREAKS_KEY, "symbols": ",".join(currencies)},
     )
-    data = r.json()
+    if data is None:
+        return None
     if "rates" not in data:
         raise ValueError(f"No 'rates' key. Full response: {data}")
-    return {"USD": Decimal(data["rates"]["USD"]),
-            "GBP": Decimal(data["rates"]["GBP"]),
-            "ZAR": Decimal(data["rates"]["ZAR"])}
+    return ProviderQuote(quote_vector(data["rates"], currencies), parse_quote_time(data.get("date")))
 
 
-def fetch_rates_from_fastforex():
-    r = requests.get(FASTFOREX_URL, params={"api_key": settings.FASTFOREX_KEY}, timeout=10)
-    data = r.json().get("results")
+def fetch_rates_from_fastforex(provider_cache):
+    body = get_provider_json("FastForex", provider_cache, FASTFOREX_URL, params={"api_key": settings.FASTFOREX_KEY})
+    if body is None:
+        return None
+    data = body.get("results")
     if not data:
-        raise ValueError(f"No 'results' key. Full response: {r.json()}")
-    return {"USD": Decimal(data["USD"]),
-            "GBP": Decimal(data["GBP"]),
-            "ZAR": Decimal(data["ZAR"])}
+        raise ValueError(f"No 'results' key. Full response: {body}")
+    return ProviderQuote(quote_vector(data, settings.RATES_CURRENCIES), parse_quote_time(body.get("updated")))
 
 
-def fetch_rates_from_apilayer():
+def fetch_rates_from_apilayer(provider_cache):
+    currencies = settings.RATES_CURRENCIES
     headers = {"apikey": settings.APILAYER_KEY}
-    r = requests.get(APILAYER_URL, params={"symbols": "USD,GBP,ZAR", "base": "USD"}, headers=headers, timeout=10)
-    data = r.json().get("rates")
+    body = get_provider_json(
+        "API Layer", provider_cache, APILAYER_URL,
+        params={"symbols": ",".join(currencies), "base": "USD"}, headers=headers,
+    )
+    if body is None:
+        return None
+    data = body.get("rates")
     if not data:
-        raise ValueError(f"No 'rates' key. Full response: {r.json()}")
-    return {"USD": Decimal("1.0"),
-            "GBP": Decimal(data["GBP"]),
-            "ZAR": Decimal(data["ZAR"])}
+        raise ValueError(f"No 'rates' key. Full response: {body}")
+    return ProviderQuote(quote_vector({**data, "USD": "1.0"}, currencies), parse_quote_time(body.get("timestamp")))
+
+
+PROVIDERS = [
+    ("CurrencyFreaks", fetch_rates_from_currencyfreaks),
+    ("FastForex", fetch_rates_from_fastforex),
+    ("API Layer", fetch_rates_from_apilayer),
+]
+
+
+def fetch_provider(func, provider_cache, deadline=None, breaker=None):
+    """
+    Fetch one provider with retries and update its cached quote.
+    A 304 Not Modified answer re-uses the cached quote.
+    """
+    start = time.perf_counter()
+    try:
+        quote = fetch_with_retry(func, provider_cache, deadline=deadline, breaker=breaker)
+    finally:
+        PROVIDER_FETCH_SECONDS.observe(time.perf_counter() - start, provider=provider_cache.name)
+    if quote is None:
+        quote = provider_cache.touch()
+        if quote is None:
+            raise Exception(f"{func.__name__} answered 304 Not Modified but no cached quote is left")
+        return quote
+    return provider_cache.store(quote)
+
+
+def fetch_all_providers(timeout=None):
+    """
+    Fetch all providers concurrently and wait at most `timeout` seconds
+    (defaults to settings.RATES_CYCLE_DEADLINE). Providers that have not
+    answered by then are reported as timed out. No call is made to a
+    provider whose cached quote is still within its refetch interval (see
+    provider_cache.py), whose monthly quota is used up, or whose circuit
+    breaker is open.
+    Returns:
+        api_results (list of (API_name, ProviderQuote)), api_status (list of tuples)
+    """
+    if timeout is None:
+        timeout = settings.RATES_CYCLE_DEADLINE
+    deadline = time.monotonic() + timeout
+
+    api_results = []
+    api_status = []
+    callable_providers = []
+    for api_name, func in PROVIDERS:
+        provider_cache = ProviderCache(api_name)
+        cached = provider_cache.fresh_quote()
+        if cached is not None:
+            quote, age = cached
+            api_results.append((api_name, quote))
+            api_status.append((api_name, True, f"Served from cache ({age:.0f}s old)"))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="cached")
+            continue
+        if provider_cache.quota_exhausted():
+            api_status.append((api_name, False, f"Monthly quota of {provider_cache.monthly_quota} calls used up"))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="quota_exhausted")
+            continue
 
+        breaker = CircuitBreaker(api_name)
+        if breaker.allow():
+            callable_providers.append((api_name, func, provider_cache, breaker))
+        else:
+            reopen = timezone.localtime(datetime.fromtimestamp(breaker.open_until, tz=dt_timezone.utc))
+            api_status.append((api_name, False, f"Circuit open, skipped until {reopen:%H:%M:%S}"))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="breaker_open")
+    if not callable_providers:
+        return api_results, api_status
 
-def aggregate_and_store_rates():
+    executor = ThreadPoolExecutor(max_workers=len(callable_providers), thread_name_prefix="rates-provider")
+    futures = {
+        executor.submit(fetch_provider, func, provider_cache, deadline=deadline, breaker=breaker): api_name
+        for api_name, func, provider_cache, breaker in callable_providers
+    }
+    done, _ = wait(futures, timeout=timeout)
+    # Don't hold the cycle for stragglers; their threads wind down on their own
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    for future, api_name in futures.items():
+        if future not in done:
+            api_status.append((api_name, False, f"Timed out after {timeout}s"))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="timeout")
+            continue
+        try:
+            rates = future.result()
+            api_results.append((api_name, rates))
+            api_status.append((api_name, True, "Fetched rates successfully"))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="success")
+        except Exception as e:
+            api_status.append((api_name, False, str(e)))
+            PROVIDER_FETCHES.inc(provider=api_name, outcome="failure")
+
+    return api_results, api_status
+
+
+def active_pairs():
+    """Whitelisted (base, target) pairs whose currencies are in RATES_CURRENCIES."""
+    universe = set(settings.RATES_CURRENCIES)
+    pairs = []
+    for base, target in CurrencyPair.objects.filter(is_active=True).order_by(
+        'base_currency', 'target_currency'
+    ).values_list('base_currency', 'target_currency'):
+        if base in universe and target in universe:
+            pairs.append((base, target))
+        else:
+            logger.warning(f"Pair {base}->{target} is outside RATES_CURRENCIES. Skipping.")
+    return pairs
+
+
+# Upsert that never moves a pair back in time: a writer committing an older
+# snapshot after a newer one leaves the newer LatestRate rows in place.
+# ON CONFLICT ... DO UPDATE ... WHERE is supported by PostgreSQL and SQLite.
+LATEST_UPSERT_SQL = """
+INSERT INTO {table} AS latest (base_currency, target_currency, rate_id, average_rate, markup_rate, fetched_at)
+VALUES {values}
+ON CONFLICT (base_currency, target_currency) DO UPDATE SET
+    rate_id = EXCLUDED.rate_id,
+    average_rate = EXCLUDED.average_rate,
+    markup_rate = EXCLUDED.markup_rate,
+    fetched_at = EXCLUDED.fetched_at
+WHERE latest.fetched_at < EXCLUDED.fetched_at
+"""
+
+
+def upsert_latest_rates(rows):
+    """Upsert saved AggregatedRate `rows` into LatestRate, keeping newer rows."""
+    ops = connection.ops
+    field = LatestRate._meta.get_field('average_rate')
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), settings.RATES_BULK_BATCH_SIZE):
+            batch = rows[start:start + settings.RATES_BULK_BATCH_SIZE]
+            params = []
+            for row in batch:
+                params.extend([
+                    row.base_currency,
+                    row.target_currency,
+                    row.pk,
+                    ops.adapt_decimalfield_value(row.average_rate, field.max_digits, field.decimal_places),
+                    ops.adapt_decimalfield_value(row.markup_rate, field.max_digits, field.decimal_places),
+                    ops.adapt_datetimefield_value(row.fetched_at),
+                ])
+            cursor.execute(
+                LATEST_UPSERT_SQL.format(
+                    table=ops.quote_name(LatestRate._meta.db_table),
+                    values=", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(batch)),
+                ),
+                params,
+            )
+
+
+def store_snapshot(rows, lease=None):
+    """
+    Write all rows of one snapshot atomically with batched INSERTs and
+    upsert them into the LatestRate table and the OHLC rollups. Pairs whose
+    LatestRate row is older than this snapshot are removed; rows from a
+    newer snapshot, committed first by another writer, are kept as they are.
+    With a `lease`, the write is fenced and raises LeaseLost if the lease
+    is no longer held.
+    Read caches are invalidated once the transaction commits.
+    """
+    if not rows:
+        return
+
+    with transaction.atomic():
+        if lease is not None:
+            lease.fence()
+        AggregatedRate.objects.bulk_create(rows, batch_size=settings.RATES_BULK_BATCH_SIZE)
+        upsert_latest_rates(rows)
+        snapshot_time = rows[0].fetched_at
+        # Pairs dropped from the whitelist or not computed this cycle
+        LatestRate.objects.filter(fetched_at__lt=snapshot_time).delete()
+        update_rollups(rows)
+
+        def committed():
+            publish_snapshot(snapshot_time)
+            ROWS_WRITTEN.inc(len(rows))
+
+        transaction.on_commit(committed)
+
+
+def lease_min_interval(interval):
+    """The lease's min_interval for cycles scheduled every `interval` seconds."""
+    return interval * LEASE_INTERVAL_SLACK
+
+
+def aggregate_and_store_rates(min_interval=None):
     """
     Fetch rates from all APIs, calculate pair rates, store in DB.
+    Runs under the cross-process aggregation lease, so at most one worker
+    aggregates per `min_interval` seconds (defaults to just under
+    settings.RATES_AGGREGATION_INTERVAL; schedulers with their own interval
+    pass lease_min_interval(interval), and a manual run passes 0).
     Returns:
         success (bool), api_status (list of tuples: (API_name, success_bool, message))
     """
-    lock_key = "rates_in_progress"
-    if not cache.add(lock_key, True, timeout=300):  # 5 min lock
-        logger.info("Another worker is already fetching rates. Skipping this run.")
+    if min_interval is None:
+        min_interval = lease_min_interval(settings.RATES_AGGREGATION_INTERVAL)
+    lease = acquire_lease(AGGREGATION_LEASE, ttl=settings.RATES_LEASE_TTL, min_interval=min_interval)
+    if lease is None:
+        logger.info("Another worker holds the aggregation lease or already ran this interval. Skipping this run.")
         return False, []
 
-    api_results = []
-    api_status = []
+    try:
+        with lease.keepalive():
+            return _aggregate_and_store_rates(lease)
+    finally:
+        lease.release()
+
+
+def _aggregate_and_store_rates(lease):
+    """One aggregation cycle, run while holding `lease`."""
+    api_results, api_status = fetch_all_providers()
+
+    if not api_results:
+        return False, api_status
+
+    pairs = active_pairs()
+    pair_quotes = cross_rates([(api_name, quote.rates) for api_name, quote in api_results], pairs)
+    quoted_at = {api_name: quote.quoted_at for api_name, quote in api_results}
+    markup = Decimal("1.0") + Decimal(str(settings.MARKUP_RATE))
+    snapshot_time = timezone.now()
+    rows = []
+
+    for base, target in pairs:
+        quotes = pair_quotes.get((base, target))
+        if not quotes:
+            logger.warning(f"No valid pair rates for {base}->{target}. Skipping.")
+            continue
+
+        avg_rate, sources = aggregate_quotes(quotes, quoted_at, now=snapshot_time)
+        if avg_rate is None:
+            logger.warning(f"All quotes rejected for {base}->{target}: {sources}. Skipping.")
+            continue
+
+        rows.append(AggregatedRate(
+            base_currency=base,
+            target_currency=target,
+            average_rate=quantize_rate(avg_rate),
+            markup_rate=quantize_rate(avg_rate * markup),
+            fetched_at=snapshot_time,
+            sources=sources
+        ))
 
     try:
-        for api_name, func in [
-            ("CurrencyFreaks", fetch_rates_from_currencyfreaks),
-            ("FastForex", fetch_rates_from_fastforex),
-            ("API Layer", fetch_rates_from_apilayer)
-        ]:
-            try:
-                rates = fetch_with_retry(func)
-                api_results.append((api_name, rates))
-                api_status.append((api_name, True, "Fetched rates successfully"))
-            except Exception as e:
-                api_status.append((api_name, False, str(e)))
-
-        if not api_results:
-            return False, api_status
-
-        pairs = [("USD", "GBP"), ("USD", "ZAR"), ("ZAR", "GBP")]
-
-        for base, target in pairs:
-            pair_rates = []
-            for _, rate_dict in api_results:
-                try:
-                    pair_rates.append(rate_dict[target] / rate_dict[base])
-                except Exception as e:
-                    logger.warning(f"Error calculating pair {base}->{target} for rates {rate_dict}: {e}")
-
-            if not pair_rates:
-                logger.warning(f"No valid pair rates for {base}->{target}. Skipping.")
-                continue
-
-            avg_rate = sum(pair_rates) / Decimal(len(pair_rates))
-            markup_rate = avg_rate * (Decimal("1.0") + Decimal(str(settings.MARKUP_RATE)))
-
-            try:
-                AggregatedRate.objects.create(
-                    base_currency=base,
-                    target_currency=target,
-                    average_rate=avg_rate,
-                    markup_rate=markup_rate,
-                    fetched_at=timezone.now()
-                )
-            except Exception as e:
-                logger.error(f"Error saving {base}->{target} to DB: {e}")
-
-        return True, api_status
+        store_snapshot(rows, lease=lease)
+    except LeaseLost as e:
+        logger.warning(f"Discarding snapshot: {e}")
+        return False, api_status
+    except Exception as e:
+        logger.error(f"Error saving snapshot of {len(rows)} rates to DB: {e}")
+        return False, api_status
+
+    return True, api_status
 
-    finally:
-        cache.delete(lock_key)
@@ -0,0 +1,121 @@
+"""
+Fan-out of committed snapshots to Server-Sent Events clients.
+
+The aggregator publishes every committed snapshot to the cache marker in
+caching.py. Each event loop runs one SnapshotBroadcaster, which polls that
+marker and, when the version changes, loads and encodes the latest rates
+once. It then hands the encoded event to every connected client's queue.
+The cost per snapshot is one query per process, whatever the number of
+clients.
+"""
+import asyncio
+import logging
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.timezone import localtime
+
+from .caching import get_snapshot
+from .models import LatestRate
+from .renderers import FastJSONRenderer
+
+logger = logging.getLogger("forex_scheduler")
+
+
+def build_snapshot_event(snapshot):
+    """The latest rates as an encoded SSE `snapshot` event, id'd by snapshot version."""
+    from .views import LATEST_RATE_FIELDS, serialize_rates
+
+    rates = serialize_rates(
+        LatestRate.objects.order_by('base_currency', 'target_currency').values_list(*LATEST_RATE_FIELDS)
+    )
+    payload = FastJSONRenderer().render({
+        "version": snapshot["version"],
+        "fetched_at": localtime(snapshot["fetched_at"]).isoformat(),
+        "count": len(rates),
+        "results": rates,
+    })
+    return f"id: {snapshot['version']}\nevent: snapshot\ndata: ".encode() + payload + b"\n\n"
+
+
+class SnapshotBroadcaster:
+    """
+    Polls for new snapshots while at least one client is subscribed. Each
+    client queue holds only the newest event, so a slow client skips
+    snapshots instead of buffering them.
+    """
+
+    def __init__(self):
+        self.subscribers = set()
+        self.latest = None  # (version, encoded event)
+        self.task = None
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=1)
+        if self.latest is not None:
+            queue.put_nowait(self.latest)
+        self.subscribers.add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._poll())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def publish(self, item):
+        for queue in self.subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+    async def _poll(self):
+        version = self.latest[0] if self.latest is not None else None
+        while self.subscribers:
+            try:
+                snapshot = await sync_to_async(get_snapshot)()
+                if snapshot is not None and snapshot["version"] != version:
+                    event = await sync_to_async(build_snapshot_event)(snapshot)
+                    version = snapshot["version"]
+                    self.latest = (version, event)
+                    self.publish(self.latest)
+            except Exception as e:
+                logger.warning(f"Snapshot stream poll failed: {e}")
+            await asyncio.sleep(settings.RATES_STREAM_POLL_INTERVAL)
+        # Nobody is listening; a later subscriber starts afresh
+        self.latest = None
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    """The broadcaster of the running event loop."""
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = SnapshotBroadcaster()
+    return broadcaster
+
+
+async def snapshot_events(last_event_id=None):
+    """
+    SSE byte stream for one client: the current snapshot (unless the client
+    already has it, per Last-Event-ID), then every new one, with keepalive
+    comments in between.
+    """
+    broadcaster = get_broadcaster()
+    queue = broadcaster.subscribe()
+    try:
+        yield f"retry: {settings.RATES_STREAM_RETRY_MS}\n\n".encode()
+        while True:
+            try:
+                version, event = await asyncio.wait_for(queue.get(), timeout=settings.RATES_STREAM_HEARTBEAT)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if version != last_event_id:
+                last_event_id = version
+                yield event
+    finally:
+        broadcaster.unsubscribe(queue)
@@ -1,3 +1,822 @@
-from django.test import TestCase
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from http.server import ThreadingHTTPServer
+from io import StringIO
+from unittest import mock, skipUnless
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.timezone import localtime
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import matrix
+from .breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from .caching import get_snapshot, require_shared_cache
+from .clients import ProviderHTTPError
+from .consensus import aggregate_quotes
+from .crossrates import cross_rates, quantize_rate, quote_vector
+from .locks import LeaseLost, acquire_lease
+from .lookups import rates_as_of
+from .management.commands.run_rate_worker import Command as RateWorkerCommand, MetricsHandler
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, CallbackMetric, Counter, Histogram, Registry
+from .models import AggregatedRate, CurrencyPair, LatestRate, RateRollup, SchedulerLease
+from .pagination import NEXT, decode_cursor, encode_cursor
+from .provider_cache import ProviderCache
+from .retention import prune_rates
+from .rollups import BUCKETS, rebuild_rollups, rebuild_rollups_for_day
+from .services import (
+    ProviderQuote, aggregate_and_store_rates, fetch_all_providers, fetch_provider, fetch_rates_from_fastforex,
+    fetch_with_retry, lease_min_interval, store_snapshot,
+)
+
+
+@skipUnless(connection.vendor == 'postgresql', "EXPLAIN plans are checked on PostgreSQL only")
+class AggregatedRateIndexTests(TestCase):
+    """The rate list filters use the composite indexes on a ~1M row table."""
+
+    @classmethod
+    def setUpTestData(cls):
+        table = connection.ops.quote_name(AggregatedRate._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"""
+                INSERT INTO {table} (base_currency, target_currency, average_rate, markup_rate, fetched_at, sources)
+                SELECT (ARRAY['USD', 'GBP', 'ZAR'])[1 + i % 3], (ARRAY['GBP', 'ZAR', 'USD'])[1 + i % 3],
+                       1.25, 1.375, now() - make_interval(secs => i * 20), '[]'
+                FROM generate_series(1, 1000000) AS i
+            """)
+            cursor.execute(f"ANALYZE {table}")
+
+    def assertIndexScan(self, queryset, index=None):
+        plan = queryset.explain()
+        self.assertNotIn("Seq Scan", plan)
+        if index is not None:
+            self.assertIn(index, plan)
+
+    def test_pair_lookup_uses_pair_index(self):
+        rates = AggregatedRate.objects.filter(base_currency='USD', target_currency='GBP')
+        self.assertIndexScan(rates.order_by('-fetched_at', '-id')[:101], 'rates_pair_fetched_idx')
+
+    def test_currency_filter_uses_indexes(self):
+        rates = AggregatedRate.objects.filter(Q(base_currency='ZAR') | Q(target_currency='ZAR'))
+        self.assertIndexScan(rates.order_by('-fetched_at', '-id')[:101])
+
+    def test_unfiltered_history_uses_fetched_at_index(self):
+        self.assertIndexScan(AggregatedRate.objects.order_by('-fetched_at', '-id')[:101], 'rates_fetched_idx')
+
+
+class RatesAPITestCase(TestCase):
+    """Authenticated API client with empty caches."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client = APIClient()
+        self.client.cookies['access_token'] = str(AccessToken.for_user(self.user))
+
+    def create_rates(self, snapshots, pairs=(('USD', 'GBP'), ('USD', 'ZAR'))):
+        """One row per pair for each of `snapshots` fetch times. Returns them newest first."""
+        rows = [
+            AggregatedRate.objects.create(
+                base_currency=base, target_currency=target,
+                average_rate=Decimal('1.5'), markup_rate=Decimal('1.65'), fetched_at=fetched_at,
+            )
+            for fetched_at in snapshots
+            for base, target in pairs
+        ]
+        return sorted(rows, key=lambda row: (row.fetched_at, row.id), reverse=True)
+
+
+class KeysetPaginationTests(RatesAPITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        # Two rows share each timestamp, so pages split snapshots and id breaks the tie
+        self.rows = self.create_rates([now - timedelta(minutes=i) for i in range(4)])
+
+    def test_next_links_walk_every_row_once(self):
+        ids, url = [], '/api/rates/?page_size=3'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids.extend(rate['id'] for rate in response.json()['results'])
+            url = response.json()['next']
+        self.assertEqual(ids, [row.id for row in self.rows])
+
+    def test_previous_link_returns_the_page_before(self):
+        first = self.client.get('/api/rates/?page_size=3').json()
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_count_only_on_request(self):
+        self.assertIsNone(self.client.get('/api/rates/').json()['count'])
+        self.assertEqual(self.client.get('/api/rates/?count=exact').json()['count'], len(self.rows))
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get('/api/rates/?cursor=not-a-cursor').status_code, 400)
+
+    def test_decode_cursor_round_trip(self):
+        row = self.rows[0]
+        cursor = encode_cursor(NEXT, row.fetched_at, row.id)
+        self.assertEqual(decode_cursor(cursor), (NEXT, row.fetched_at, row.id))
+
+
+class ExportTests(RatesAPITestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        [self.old] = self.create_rates([now - timedelta(days=3)], pairs=(('USD', 'GBP'),))
+        [self.new] = self.create_rates([now], pairs=(('USD', 'ZAR'),))
+
+    def export(self, url, **headers):
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_stream(self):
+        lines = self.export('/api/rates/export/csv/').splitlines()
+        self.assertEqual(lines[0], 'id,base_currency,target_currency,average_rate,markup_rate,fetched_at')
+        self.assertEqual([line.split(',')[0] for line in lines[1:]], [str(self.old.id), str(self.new.id)])
+
+    def test_ndjson_stream(self):
+        rows = [json.loads(line) for line in self.export('/api/rates/export/ndjson/').splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.old.id, self.new.id])
+        self.assertEqual(rows[0]['markup_rate'], '1.6500000000')
+
+    def test_filters(self):
+        day = localtime(self.new.fetched_at).date().isoformat()
+        rows = self.export(f'/api/rates/export/ndjson/?start={day}&end={day}').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.new.id])
+        rows = self.export('/api/rates/export/ndjson/?currency=gbp').splitlines()
+        self.assertEqual([json.loads(row)['id'] for row in rows], [self.old.id])
+
+    def test_bad_date_and_format_are_rejected(self):
+        response = self.client.get('/api/rates/export/csv/?start=2025-13-01', HTTP_ACCEPT='text/csv')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(self.client.get('/api/rates/export/xml/').status_code, 400)
+
+    def test_format_specific_accept_header(self):
+        for export_format, media_type in (('csv', 'text/csv'), ('ndjson', 'application/x-ndjson')):
+            response = self.client.get(f'/api/rates/export/{export_format}/', HTTP_ACCEPT=media_type)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Content-Type'], media_type)
+
+
+class LatestRateTests(RatesAPITestCase):
+    def store(self, fetched_at, pairs):
+        store_snapshot([
+            AggregatedRate(
+                base_currency=base, target_currency=target,
+                average_rate=Decimal('1.5'), markup_rate=Decimal('1.65'), fetched_at=fetched_at,
+            )
+            for base, target in pairs
+        ])
+
+    def test_latest_holds_only_the_newest_snapshot(self):
+        now = timezone.now()
+        self.store(now - timedelta(minutes=1), [('USD', 'GBP'), ('USD', 'ZAR')])
+        self.store(now, [('USD', 'GBP')])
+
+        self.assertEqual(list(LatestRate.objects.values_list('target_currency', 'fetched_at')), [('GBP', now)])
+        cache.clear()
+        results = self.client.get('/api/rates/latest/').json()['results']
+        self.assertEqual([(rate['base_currency'], rate['target_currency']) for rate in results], [('USD', 'GBP')])
+
+    def test_late_older_snapshot_does_not_replace_newer_rows(self):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store(now, [('USD', 'GBP'), ('USD', 'ZAR')])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store(now - timedelta(minutes=1), [('USD', 'GBP')])
+
+        self.assertEqual(
+            sorted(LatestRate.objects.values_list('target_currency', 'fetched_at')), [('GBP', now), ('ZAR', now)]
+        )
+        self.assertEqual(get_snapshot()['fetched_at'], now)
+
+
+class SnapshotWriteTests(TestCase):
+    def rows(self, fetched_at):
+        return [
+            AggregatedRate(base_currency='USD', target_currency=target, average_rate=Decimal('1.5'),
+                           markup_rate=Decimal('1.65'), fetched_at=fetched_at)
+            for target in ('GBP', 'ZAR', 'EUR', 'BWP', 'ZMW')
+        ]
+
+    @override_settings(RATES_BULK_BATCH_SIZE=2)
+    def test_rows_are_inserted_in_batches(self):
+        table = AggregatedRate._meta.db_table
+        with CaptureQueriesContext(connection) as queries:
+            store_snapshot(self.rows(timezone.now()))
+        inserts = [query for query in queries if query['sql'].startswith(f'INSERT INTO "{table}"')]
+        self.assertEqual(len(inserts), 3)
+        self.assertEqual(AggregatedRate.objects.count(), 5)
+        self.assertEqual(LatestRate.objects.count(), 5)
+
+    def test_failed_write_rolls_back_the_whole_snapshot(self):
+        store_snapshot(self.rows(timezone.now() - timedelta(minutes=1)))
+        with mock.patch('apps.rates.services.update_rollups', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                store_snapshot(self.rows(timezone.now()))
+
+        self.assertEqual(AggregatedRate.objects.count(), 5)
+        self.assertEqual(set(LatestRate.objects.values_list('rate_id', flat=True)),
+                         set(AggregatedRate.objects.values_list('id', flat=True)))
+        self.assertEqual(RateRollup.objects.filter(bucket='1d').count(), 5)
+
+
+class ResponseCacheTests(RatesAPITestCase):
+    def store(self, fetched_at, markup_rate):
+        with self.captureOnCommitCallbacks(execute=True):
+            store_snapshot([
+                AggregatedRate(base_currency='USD', target_currency='GBP', average_rate=Decimal('1.5'),
+                               markup_rate=Decimal(markup_rate), fetched_at=fetched_at)
+            ])
+
+    def markup_rates(self, response):
+        return [rate['markup_rate'] for rate in response.json()['results']]
+
+    def test_etag_revalidation_and_new_snapshot_invalidation(self):
+        now = timezone.now()
+        self.store(now - timedelta(minutes=1), '1.65')
+        first = self.client.get('/api/rates/latest/')
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/rates/latest/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Writes that bypass store_snapshot are not seen until the next snapshot
+        LatestRate.objects.update(markup_rate=Decimal('9'))
+        self.assertEqual(self.markup_rates(self.client.get('/api/rates/latest/')), ['1.6500000000'])
+
+        self.store(now, '1.70')
+        response = self.client.get('/api/rates/latest/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.markup_rates(response), ['1.7000000000'])
+
+
+class SchedulerLeaseTests(TestCase):
+    def expire(self, name):
+        SchedulerLease.objects.filter(name=name).update(expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_held_lease_is_not_granted_twice(self):
+        lease = acquire_lease('job', ttl=60)
+        self.assertIsNotNone(lease)
+        self.assertIsNone(acquire_lease('job', ttl=60))
+        lease.release()
+        self.assertIsNotNone(acquire_lease('job', ttl=60))
+
+    def test_min_interval_applies_after_release(self):
+        acquire_lease('job', ttl=60, min_interval=300).release()
+        self.assertIsNone(acquire_lease('job', ttl=60, min_interval=300))
+        self.assertIsNotNone(acquire_lease('job', ttl=60, min_interval=0))
+
+    def test_expired_holder_is_fenced_out(self):
+        stale = acquire_lease('job', ttl=60)
+        self.expire('job')
+        fresh = acquire_lease('job', ttl=60)
+        self.assertGreater(fresh.token, stale.token)
+
+        with self.assertRaises(LeaseLost):
+            stale.renew()
+        with self.assertRaises(LeaseLost):
+            store_snapshot([
+                AggregatedRate(base_currency='USD', target_currency='GBP', average_rate=Decimal('1.5'),
+                               markup_rate=Decimal('1.65'), fetched_at=timezone.now())
+            ], lease=stale)
+        self.assertFalse(AggregatedRate.objects.exists())
+        with transaction.atomic():
+            fresh.fence()
+
+
+class RollupTests(RatesAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+        for second, rate in enumerate(['1.0', '1.2', '0.9'], start=1):
+            store_snapshot([
+                AggregatedRate(base_currency='USD', target_currency='GBP', average_rate=Decimal(rate),
+                               markup_rate=Decimal(rate), fetched_at=self.hour + timedelta(seconds=second))
+            ])
+
+    def ohlc(self, bucket):
+        rollup = RateRollup.objects.get(bucket=bucket)
+        return (rollup.open_rate, rollup.high_rate, rollup.low_rate, rollup.close_rate,
+                rollup.rate_sum, rollup.sample_count)
+
+    def test_snapshots_fold_into_every_bucket(self):
+        self.assertEqual(RateRollup.objects.count(), len(BUCKETS))
+        for bucket in BUCKETS:
+            self.assertEqual(
+                self.ohlc(bucket),
+                (Decimal('1.0'), Decimal('1.2'), Decimal('0.9'), Decimal('0.9'), Decimal('3.1'), 3),
+            )
+        self.assertEqual(RateRollup.objects.get(bucket='1d').bucket_start, self.hour.replace(hour=0))
+
+    def test_rebuild_matches_incremental_rollups(self):
+        incremental = {bucket: self.ohlc(bucket) for bucket in BUCKETS}
+        self.assertEqual(rebuild_rollups_for_day(self.hour.date()), 3)
+        self.assertEqual({bucket: self.ohlc(bucket) for bucket in BUCKETS}, incremental)
+
+    def test_ohlc_endpoint(self):
+        response = self.client.get('/api/rates/ohlc/?base=USD&target=GBP&bucket=1h')
+        self.assertEqual(response.status_code, 200)
+        [result] = response.json()['results']
+        self.assertEqual((result['open'], result['high'], result['low'], result['close'], result['samples']),
+                         ('1.0000000000', '1.2000000000', '0.9000000000', '0.9000000000', 3))
+        self.assertEqual(self.client.get('/api/rates/ohlc/?base=USD&target=GBP&bucket=2h').status_code, 400)
+
+
+@override_settings(RATES_RAW_RETENTION_DAYS=30)
+class RetentionTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for days in range(40, -1, -1):
+            store_snapshot([
+                AggregatedRate(base_currency='USD', target_currency='GBP', average_rate=Decimal('1.5'),
+                               markup_rate=Decimal('1.65'), fetched_at=now - timedelta(days=days))
+            ])
+
+    def daily_rollups(self):
+        return RateRollup.objects.filter(bucket='1d').count()
+
+    def test_prune_keeps_rollups_of_deleted_rows(self):
+        result = prune_rates(batch_size=7)
+        self.assertEqual(result['raw'], 11)
+        self.assertEqual(AggregatedRate.objects.count(), 30)
+        self.assertEqual(self.daily_rollups(), 41)
+
+    def test_rebuild_refuses_pruned_days(self):
+        prune_rates()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rate_rollups', days=40, stdout=StringIO())
+        self.assertEqual(self.daily_rollups(), 41)
+
+    def test_rebuild_all_starts_inside_retention_window(self):
+        prune_rates()
+        call_command('rebuild_rate_rollups', all=True, stdout=StringIO())
+        self.assertEqual(self.daily_rollups(), 41)
+        self.assertEqual(RateRollup.objects.get(bucket='1d', bucket_start__date=timezone.localdate()).sample_count, 1)
+
+    def test_rebuild_only_replaces_pairs_it_read(self):
+        other = RateRollup.objects.get(bucket='1d', bucket_start__date=timezone.localdate())
+        other.pk, other.target_currency = None, 'ZAR'
+        other.save()
+        rebuild_rollups(timezone.localdate(), timezone.localdate())
+        self.assertTrue(RateRollup.objects.filter(target_currency='ZAR').exists())
+
+
+@override_settings(RATES_CURRENCIES=['USD', 'GBP', 'VND'])
+class CurrencyPairTests(TestCase):
+    def test_codes_are_upper_cased_and_checked_against_the_universe(self):
+        pair = CurrencyPair(base_currency='vnd', target_currency='usd')
+        pair.full_clean()
+        self.assertEqual((pair.base_currency, pair.target_currency), ('VND', 'USD'))
+
+        with self.assertRaises(ValidationError) as raised:
+            CurrencyPair(base_currency='USD', target_currency='ZAR').full_clean()
+        self.assertIn('target_currency', raised.exception.message_dict)
+        with self.assertRaises(ValidationError):
+            CurrencyPair(base_currency='USD', target_currency='usd').full_clean()
+
+    def test_small_rates_keep_their_precision(self):
+        [(_, rate)] = cross_rates([('p', quote_vector({'USD': '1', 'VND': '26345.5'}, ['USD', 'VND']))],
+                                  [('VND', 'USD')])[('VND', 'USD')]
+        stored = quantize_rate(rate)
+        self.assertLess(abs(stored - rate) / rate, Decimal('1e-5'))
+
+
+@override_settings(RATES_MAX_QUOTE_AGE=3600, RATES_OUTLIER_MAD_THRESHOLD=3.5, RATES_PROVIDER_WEIGHTS={'a': 3})
+class ConsensusTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+
+    def test_outlier_is_rejected(self):
+        quotes = [('a', Decimal('0.74')), ('b', Decimal('0.741')), ('c', Decimal('0.80'))]
+        rate, sources = aggregate_quotes(quotes, {}, self.now, method='mean')
+        self.assertEqual(rate, Decimal('0.7405'))
+        self.assertEqual([(s['provider'], s['used'], s['reason']) for s in sources],
+                         [('a', True, ''), ('b', True, ''), ('c', False, 'outlier')])
+
+    def test_stale_quote_is_rejected(self):
+        quotes = [('a', Decimal('0.74')), ('b', Decimal('0.75'))]
+        quoted_at = {'a': self.now - timedelta(hours=2), 'b': self.now}
+        rate, sources = aggregate_quotes(quotes, quoted_at, self.now, method='mean')
+        self.assertEqual(rate, Decimal('0.75'))
+        self.assertEqual(sources[0]['reason'], 'stale')
+
+    def test_every_quote_rejected(self):
+        rate, _ = aggregate_quotes([('a', Decimal('0.74'))], {'a': self.now - timedelta(days=1)}, self.now)
+        self.assertIsNone(rate)
+
+    def test_estimators(self):
+        quotes = [('a', Decimal('1.00')), ('b', Decimal('1.01')), ('c', Decimal('1.03'))]
+        self.assertEqual(aggregate_quotes(quotes, {}, self.now, method='median')[0], Decimal('1.01'))
+        self.assertEqual(aggregate_quotes(quotes, {}, self.now, method='weighted_mean')[0], Decimal('1.008'))
+
+    def test_realistic_provider_spreads_are_kept(self):
+        # Two providers agree exactly; the third is off by the spreads seen between public rate APIs
+        for quotes in (
+            [('a', Decimal('0.7400')), ('b', Decimal('0.7400')), ('c', Decimal('0.7415'))],  # 20 bp
+            [('a', Decimal('18.2100')), ('b', Decimal('18.2100')), ('c', Decimal('18.2650'))],  # 30 bp
+            [('a', Decimal('1.08500')), ('b', Decimal('1.08510')), ('c', Decimal('1.08020'))],  # 45 bp
+        ):
+            _, sources = aggregate_quotes(quotes, {}, self.now, method='trimmed_mean')
+            self.assertTrue(all(source['used'] for source in sources), quotes)
+
+    def test_quote_a_percent_off_agreeing_providers_is_rejected(self):
+        quotes = [('a', Decimal('18.21')), ('b', Decimal('18.21')), ('c', Decimal('18.40'))]
+        rate, sources = aggregate_quotes(quotes, {}, self.now, method='mean')
+        self.assertEqual(rate, Decimal('18.21'))
+        self.assertEqual(sources[2]['reason'], 'outlier')
+
+
+@skipUnless(os.getenv('RATES_BENCHMARKS'), "set RATES_BENCHMARKS=1 to run benchmarks")
+class ConsensusBenchmark(TestCase):
+    def test_aggregate_quotes_per_pair(self):
+        now = timezone.now()
+        for providers in (3, 5, 10):
+            quotes = [(f'p{i}', Decimal('18.21') + Decimal(i) / 1000) for i in range(providers)]
+            quoted_at = {provider: now for provider, _ in quotes}
+            runs = 2000
+            start = time.perf_counter()
+            for _ in range(runs):
+                aggregate_quotes(quotes, quoted_at, now)
+            print(f"\naggregate_quotes, {providers} providers: {(time.perf_counter() - start) / runs * 1e6:.1f} us/pair")
+
+
+@override_settings(RATES_BREAKER_FAILURE_THRESHOLD=3, RATES_BREAKER_COOLDOWN=60, RATES_BREAKER_MAX_COOLDOWN=3600)
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.breaker = CircuitBreaker('Test Provider')
+
+    def end_cooldown(self):
+        cache.set(self.breaker.key, {**cache.get(self.breaker.key), "open_until": time.time() - 1}, timeout=None)
+
+    def test_opens_after_threshold_and_probes_once(self):
+        for _ in range(2):
+            self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+
+        self.end_cooldown()
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_failed_probe_doubles_cooldown(self):
+        for _ in range(3):
+            self.breaker.record_failure()
+        self.end_cooldown()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_failure()
+        self.assertEqual(cache.get(self.breaker.key)["cooldown"], 120)
+
+    def test_permanent_failure_opens_for_max_cooldown(self):
+        self.breaker.record_failure(permanent=True)
+        self.assertEqual(cache.get(self.breaker.key)["cooldown"], 3600)
+
+    @mock.patch('apps.rates.services.time.sleep')
+    def test_retry_after_applies_to_its_own_attempt_only(self, sleep):
+        errors = iter([ProviderHTTPError("429", 429, retry_after=30), ValueError("bad body"), ValueError("bad body")])
+
+        def fetch():
+            raise next(errors)
+
+        with self.assertRaises(Exception), self.assertLogs('forex_scheduler', 'WARNING'):
+            fetch_with_retry(fetch, breaker=self.breaker)
+        self.assertEqual(sleep.call_args_list[0], mock.call(30))
+        self.assertLess(sleep.call_args_list[1].args[0], 30)
+        # The last failure sent no Retry-After: one failure below the threshold keeps the breaker closed
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+@override_settings(RATES_CYCLE_DEADLINE=0.5)
+class ProviderFanOutTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        CurrencyPair.objects.exclude(base_currency='USD', target_currency='GBP').update(is_active=False)
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def provider(self, gbp, wait=False):
+        def fetch(provider_cache):
+            if wait:
+                self.release.wait(5)
+            return ProviderQuote({'USD': Decimal(1), 'GBP': Decimal(gbp)}, None)
+        return fetch
+
+    def test_slow_provider_times_out_and_the_others_are_aggregated(self):
+        providers = [('A', self.provider('0.74')), ('B', self.provider('0.76')), ('Slow', self.provider('0.9', wait=True))]
+        start = time.monotonic()
+        with mock.patch('apps.rates.services.PROVIDERS', providers):
+            success, status = aggregate_and_store_rates(min_interval=0)
+
+        self.assertLess(time.monotonic() - start, 2)
+        self.assertTrue(success)
+        self.assertIn(('Slow', False, 'Timed out after 0.5s'), status)
+        rate = AggregatedRate.objects.get()
+        self.assertEqual(rate.average_rate, Decimal('0.75'))
+        self.assertEqual([source['provider'] for source in rate.sources], ['A', 'B'])
+
+
+class ProviderCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.provider_cache = ProviderCache("FastForex")
+
+    def response(self, status_code, body=None, headers=None):
+        return mock.Mock(status_code=status_code, headers=headers or {}, json=mock.Mock(return_value=body))
+
+    def test_not_modified_reuses_the_cached_quote(self):
+        body = {"results": {"USD": 1, "GBP": "0.75", "ZAR": "18"}, "updated": "2025-09-01 12:00:00"}
+        client = mock.Mock()
+        client.get.side_effect = [self.response(200, body, {"ETag": '"v1"'}), self.response(304)]
+        with mock.patch('apps.rates.services.get_client', return_value=client):
+            first = fetch_provider(fetch_rates_from_fastforex, self.provider_cache)
+            second = fetch_provider(fetch_rates_from_fastforex, ProviderCache("FastForex"))
+
+        self.assertEqual(second, first)
+        self.assertEqual(first.rates["GBP"], Decimal("0.75"))
+        self.assertNotIn("If-None-Match", client.get.call_args_list[0].kwargs["headers"])
+        self.assertEqual(client.get.call_args_list[1].kwargs["headers"]["If-None-Match"], '"v1"')
+        self.assertEqual(self.provider_cache.calls_this_month(), 2)
+
+    @override_settings(RATES_PROVIDER_MONTHLY_QUOTA={"CurrencyFreaks": 0, "FastForex": 2, "API Layer": 0})
+    def test_exhausted_quota_refuses_the_call(self):
+        self.provider_cache.record_call()
+        self.assertFalse(self.provider_cache.quota_exhausted())
+        self.provider_cache.record_call()
+        self.assertTrue(self.provider_cache.quota_exhausted())
+
+        with mock.patch('apps.rates.services.get_client') as get_client:
+            results, status = fetch_all_providers(timeout=1)
+        get_client.assert_not_called()
+        self.assertEqual(results, [])
+        self.assertIn(("FastForex", False, "Monthly quota of 2 calls used up"), status)
+
+
+class SharedCacheTests(TestCase):
+    LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+    FILE = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp/rates-cache'}}
+
+    @override_settings(CACHES=LOCMEM, RATES_ALLOW_LOCAL_CACHE=False)
+    def test_provider_callers_refuse_a_per_process_cache(self):
+        with self.assertRaises(ImproperlyConfigured):
+            require_shared_cache()
+        for command in ('run_rate_worker', 'fetch_forex_rates'):
+            with self.assertRaisesMessage(CommandError, 'local to each process'):
+                call_command(command)
+
+    def test_shared_or_explicitly_allowed_cache_is_accepted(self):
+        with override_settings(CACHES=self.LOCMEM, RATES_ALLOW_LOCAL_CACHE=True):
+            require_shared_cache()
+        with override_settings(CACHES=self.FILE, RATES_ALLOW_LOCAL_CACHE=False):
+            require_shared_cache()
+
+
+class RateStreamTests(RatesAPITestCase):
+    def test_refused_under_wsgi(self):
+        self.assertEqual(self.client.get('/api/rates/stream/').status_code, 501)
+
+    async def test_streams_under_asgi(self):
+        client = AsyncClient()
+        client.cookies['access_token'] = self.client.cookies['access_token'].value
+        response = await client.get('/api/rates/stream/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = aiter(response.streaming_content)
+        self.assertEqual(await anext(stream), f"retry: {settings.RATES_STREAM_RETRY_MS}\n\n".encode())
+        await stream.aclose()
+
+
+@override_settings(MARKUP_RATE=0.1)
+class QuoteTests(RatesAPITestCase):
+    def setUp(self):
+        super().setUp()
+        matrix._matrix = None
+        self.store(timezone.now(), {('USD', 'GBP'): '0.75', ('USD', 'ZAR'): '18'})
+
+    def store(self, fetched_at, rates):
+        store_snapshot([
+            AggregatedRate(base_currency=base, target_currency=target, average_rate=Decimal(rate),
+                           markup_rate=quantize_rate(Decimal(rate) * Decimal('1.1')), fetched_at=fetched_at)
+            for (base, target), rate in rates.items()
+        ])
+
+    def quote(self, base, target, amount):
+        return self.client.get(f'/api/rates/quote/?base={base}&target={target}&amount={amount}')
+
+    def test_direct_inverse_and_cross_quotes(self):
+        response = self.quote('USD', 'GBP', 100)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['derivation'], response.json()['converted_amount']), ('direct', '82.50'))
+        self.assertEqual(self.quote('GBP', 'USD', 100).json()['derivation'], 'inverse')
+        cross = self.quote('GBP', 'ZAR', 100).json()
+        self.assertEqual((cross['derivation'], cross['average_rate']), ('cross', '24.0000000000'))
+
+    def test_huge_amounts_are_rejected(self):
+        for amount in ('1e26', '1' * 27, '1e15'):
+            self.assertEqual(self.quote('USD', 'GBP', amount).status_code, 400)
+        self.client.cookies['csrf_token'] = 't'
+        response = self.client.post('/api/rates/quote/batch/', {'base': 'USD', 'target': 'GBP', 'amounts': [1, '1e26']},
+                                    format='json', HTTP_X_CSRFTOKEN='t')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.quote('USD', 'GBP', '999999999999999.99').status_code, 200)
+
+    def test_batch_body_must_be_an_object(self):
+        self.client.cookies['csrf_token'] = 't'
+        for body in ([{'base': 'USD', 'target': 'GBP', 'amounts': [1]}], 'USD', 1):
+            response = self.client.post('/api/rates/quote/batch/', body, format='json', HTTP_X_CSRFTOKEN='t')
+            self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/rates/quote/batch/', {'base': 'USD', 'target': 'GBP', 'amounts': [100]},
+                                    format='json', HTTP_X_CSRFTOKEN='t')
+        self.assertEqual(response.json()['results'], [{'amount': '100.00', 'converted_amount': '82.50'}])
+
+    def test_stale_latest_rows_are_not_quoted(self):
+        matrix._matrix = None
+        now = timezone.now()
+        self.store(now, {('USD', 'GBP'): '0.75', ('USD', 'ZAR'): '18', ('ZAR', 'GBP'): '0.05'})
+        LatestRate.objects.filter(base_currency='ZAR').update(fetched_at=now - timedelta(days=90))
+        cache.clear()
+
+        quote = self.quote('ZAR', 'GBP', 100).json()
+        self.assertEqual((quote['derivation'], quote['average_rate']), ('cross', '0.0416666667'))
+
+
+class AsOfLookupTests(RatesAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.now = timezone.now()
+        self.create_rates([self.now, self.now - timedelta(hours=1)])
+        self.newer, self.older = AggregatedRate.objects.filter(target_currency='GBP').order_by('-fetched_at')
+
+    def test_newest_rate_at_or_before_each_time(self):
+        lookups = [
+            ('USD', 'GBP', self.now - timedelta(minutes=30)),
+            ('USD', 'GBP', self.now),
+            ('USD', 'GBP', self.now - timedelta(hours=2)),
+            ('GBP', 'USD', self.now),
+            ('USD', 'GBP', self.now),
+        ]
+        found = [rate.id if rate else None for rate in rates_as_of(lookups)]
+        self.assertEqual(found, [self.older.id, self.newer.id, None, None, self.newer.id])
+
+    def test_lookup_endpoint(self):
+        self.client.cookies['csrf_token'] = 't'
+        at = localtime(self.now - timedelta(minutes=30)).replace(tzinfo=None).isoformat()
+        response = self.client.post('/api/rates/lookup/', {'lookups': [{'base': 'usd', 'target': 'gbp', 'at': at}]},
+                                    format='json', HTTP_X_CSRFTOKEN='t')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'][0]['id'], self.older.id)
+
+        response = self.client.post('/api/rates/lookup/', {'lookups': [{'base': 'USD', 'target': 'GBP', 'at': 'soon'}]},
+                                    format='json', HTTP_X_CSRFTOKEN='t')
+        self.assertEqual(response.status_code, 400)
+
+    def test_non_object_body_is_rejected(self):
+        self.client.cookies['csrf_token'] = 't'
+        for body in ([{'base': 'USD', 'target': 'GBP', 'at': self.now.isoformat()}], 'USD', 1):
+            response = self.client.post('/api/rates/lookup/', body, format='json', HTTP_X_CSRFTOKEN='t')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json()['detail'], "'lookups' must be a non-empty list.")
+
+
+class RateWorkerTests(TestCase):
+    @mock.patch('apps.rates.auto_fetch.aggregate_and_store_rates', return_value=(True, []))
+    def test_worker_interval_sets_lease_interval(self, aggregate):
+        command = RateWorkerCommand()
+        command.interval, command.health, command.health_file = 30, {"failures": 0}, ""
+        command.run_cycle()
+        aggregate.assert_called_once_with(min_interval=lease_min_interval(30))
+        self.assertLess(lease_min_interval(30), 30)
+
+    @override_settings(SCHEDULER_AUTOSTART=True)
+    @mock.patch('apps.rates.auto_fetch.start_scheduler')
+    def test_autostart_skipped_in_the_worker(self, start_scheduler):
+        config = apps.get_app_config('rates')
+        with mock.patch('sys.argv', ['manage.py', 'run_rate_worker']):
+            config.ready()
+        start_scheduler.assert_not_called()
+        with mock.patch('sys.argv', ['manage.py', 'runserver']):
+            config.ready()
+        start_scheduler.assert_called_once()
+
+    def test_retention_does_not_block_the_loop(self):
+        release = threading.Event()
+        command = RateWorkerCommand()
+        command.retention_thread = None
+        with mock.patch('apps.rates.management.commands.run_rate_worker.run_retention',
+                        side_effect=lambda: release.wait(5)) as run_retention:
+            command.start_retention()
+            command.start_retention()  # still running: not started twice
+            self.assertTrue(command.retention_thread.is_alive())
+            release.set()
+            command.retention_thread.join(5)
+        run_retention.assert_called_once()
+
+    def test_unwritable_health_file_is_logged(self):
+        command = RateWorkerCommand()
+        command.interval, command.health = 30, {}
+        command.health_file = '/nonexistent-dir/worker-health.json'
+        with self.assertLogs('forex_scheduler', 'WARNING') as logs:
+            command.report_health()
+        self.assertIn('Could not write health file', logs.output[0])
+
+
+class MetricsRegistryTests(TestCase):
+    def test_text_exposition_format(self):
+        registry = Registry()
+        counter = registry.register(Counter("jobs_total", "Jobs run.", ["result"]))
+        histogram = registry.register(Histogram("job_seconds", "Job duration.", buckets=(0.5, 1)))
+        registry.register(CallbackMetric("queue_depth", "Queued jobs.", "gauge", lambda: [({}, 3)]))
+        counter.inc(result='ok')
+        counter.inc(2, result='say "hi"\n')
+        histogram.observe(0.25)
+        histogram.observe(0.75)
+
+        self.assertEqual(registry.render(), "\n".join([
+            "# HELP jobs_total Jobs run.",
+            "# TYPE jobs_total counter",
+            'jobs_total{result="ok"} 1',
+            'jobs_total{result="say \\"hi\\"\\n"} 2',
+            "# HELP job_seconds Job duration.",
+            "# TYPE job_seconds histogram",
+            'job_seconds_bucket{le="0.5"} 1',
+            'job_seconds_bucket{le="1.0"} 2',
+            'job_seconds_bucket{le="+Inf"} 2',
+            "job_seconds_count 2",
+            "job_seconds_sum 1.0",
+            "# HELP queue_depth Queued jobs.",
+            "# TYPE queue_depth gauge",
+            "queue_depth 3",
+        ]) + "\n")
+
+    def test_misuse_and_failing_callbacks(self):
+        registry = Registry()
+        counter = registry.register(Counter("jobs_total", "Jobs run.", ["result"]))
+        with self.assertRaises(ValueError):
+            registry.register(Counter("jobs_total", "Again."))
+        with self.assertRaises(ValueError):
+            counter.inc(status='ok')
+        registry.register(CallbackMetric("broken", "Fails.", "gauge", lambda: 1 / 0))
+        self.assertIn("# broken unavailable: division by zero", registry.render())
+        self.assertIn("# TYPE jobs_total counter", registry.render())
+
+
+class MetricsEndpointTests(TestCase):
+    @override_settings(METRICS_TOKEN='')
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_requires_bearer_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get('/api/metrics/', HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'# TYPE rates_aggregation_cycles_total counter', response.content)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_worker_metrics_port_requires_bearer_token(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f'http://127.0.0.1:{server.server_address[1]}/metrics'
+
+        for headers in ({}, {'Authorization': 'Bearer wrong'}):
+            with self.assertRaises(HTTPError) as error:
+                urlopen(Request(url, headers=headers), timeout=5)
+            self.assertEqual(error.exception.code, 401)
+        with urlopen(Request(url, headers={'Authorization': 'Bearer scrape-secret'}), timeout=5) as response:
+            self.assertEqual(response.headers['Content-Type'], METRICS_CONTENT_TYPE)
+            self.assertIn(b'# TYPE rates_provider_retries_total counter', response.read())
+        with override_settings(METRICS_TOKEN=''), self.assertRaises(HTTPError) as error:
+            urlopen(Request(url, headers={'Authorization': 'Bearer '}), timeout=5)
+        self.assertEqual(error.exception.code, 403)
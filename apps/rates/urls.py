@@ -1,13 +1,36 @@
 from django.urls import path
-from . import views
+from . import async_views, views
 
 urlpatterns = [
-    path('rates/', views.list_rates, name='list_rates'),  # GET latest aggregated rates
-    path('rates/<str:currency>/', views.rates_for_currency, name='rates_for_currency'),
-   
+    path('rates/', views.list_rates, name='list_rates'),  # GET aggregated rates, newest first
+
+    # Latest snapshot
+    path('rates/latest/', views.latest_rates_all, name='latest_rates_all'),
+    path('rates/latest/<str:currency>/', views.latest_rates_currency, name='latest_rates_currency'),
 
     # Historical rates
     path('rates/history/', views.historical_rates_all, name='historical_rates_all'),
-  
+    path('rates/ohlc/', views.ohlc_rates, name='ohlc_rates'),  # bucketed open/high/low/close
+    path('rates/export/<str:export_format>/', views.export_rates, name='export_rates'),  # csv or ndjson
+    path('rates/lookup/', views.rates_lookup, name='rates_lookup'),  # POST batch of as-of lookups
+
+    # Conversion quotes from the in-memory rate matrix
+    path('rates/quote/', views.quote_rate, name='quote_rate'),
+    path('rates/quote/batch/', views.quote_batch, name='quote_batch'),
+
+    # Async variants of the read endpoints (serve through ASGI)
+    path('rates/async/', async_views.list_rates, name='async_list_rates'),
+    path('rates/async/latest/', async_views.latest_rates_all, name='async_latest_rates_all'),
+    path('rates/async/latest/<str:currency>/', async_views.latest_rates_currency, name='async_latest_rates_currency'),
+    path('rates/async/history/', async_views.historical_rates_all, name='async_historical_rates_all'),
+    path('rates/async/<str:currency>/', async_views.rates_for_currency, name='async_rates_for_currency'),
 
+    # Push updates (ASGI only; 501 under WSGI)
+    path('rates/stream/', async_views.rates_stream, name='rates_stream'),  # Server-Sent Events
+
+    # Prometheus metrics (bearer token METRICS_TOKEN; disabled while unset)
+    path('metrics/', views.metrics, name='metrics'),
+
+    # Keep last: matches any single segment, so it would shadow the routes above
+    path('rates/<str:currency>/', views.rates_for_currency, name='rates_for_currency'),
 ]
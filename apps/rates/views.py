@@ -1,107 +1,164 @@
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, renderer_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.conf import settings
 from django.db.models import Q
+from django.http import HttpResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.utils.timezone import localtime
 from datetime import datetime, time
-from .models import AggregatedRate
-from .serializers import AggregatedRateSerializer
+from decimal import Decimal, InvalidOperation
+from .caching import cached_rates_response
+from .crossrates import RATE_DECIMAL_PLACES
+from .export import EXPORT_FORMATS
+from .lookups import rates_as_of
+from .matrix import get_matrix, quantize_amount
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY, scrape_refusal
+from .models import AggregatedRate, LatestRate, RateRollup
+from .pagination import KeysetPaginator
+from .renderers import FastJSONRenderer, ignore_accept
+from .rollups import BUCKETS
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 
+# Column order expected by serialize_rates
+RATE_FIELDS = ('id', 'base_currency', 'target_currency', 'average_rate', 'markup_rate', 'fetched_at')
+LATEST_RATE_FIELDS = ('rate_id',) + RATE_FIELDS[1:]
 
-def serialize_rates(rates_queryset):
+
+def format_rate(value):
+    """A rate with all its stored decimal places, like the model serializer."""
+    return f"{value:.{RATE_DECIMAL_PLACES}f}"
+
+
+def iter_serialized_rates(rows):
+    """
+    Serialize rate rows (values_list tuples in RATE_FIELDS order) one by one
+    and convert fetched_at to Central Africa Time (CAT). Output matches
+    AggregatedRateSerializer. Rows arrive ordered by fetched_at and a snapshot
+    shares one timestamp, so only the last conversion is remembered.
+    """
+    last_fetched_at = local_time = None
+    for pk, base, target, average_rate, markup_rate, fetched_at in rows:
+        if fetched_at != last_fetched_at:
+            last_fetched_at, local_time = fetched_at, localtime(fetched_at).isoformat()
+        yield {
+            "id": pk,
+            "base_currency": base,
+            "target_currency": target,
+            "average_rate": format_rate(average_rate),
+            "markup_rate": format_rate(markup_rate),
+            "fetched_at": local_time,
+        }
+
+
+def serialize_rates(rows):
+    return list(iter_serialized_rates(rows))
+
+
+def local_day_bounds(date_str):
+    """
+    First and last instant of a YYYY-MM-DD day in the current timezone (CAT).
+    Raises ValueError on a malformed date.
+    """
+    local_date = datetime.strptime(date_str, "%Y-%m-%d")
+    tz = timezone.get_current_timezone()  # should be CAT if TIME_ZONE='Africa/Harare'
+    start = timezone.make_aware(datetime.combine(local_date, time.min), tz)
+    end = timezone.make_aware(datetime.combine(local_date, time.max), tz)
+    return start, end
+
+
+def paginated_response(request, rates, not_found_detail):
     """
-    Serialize rates and convert fetched_at to Central Africa Time (CAT)
+    One keyset page of `rates`, newest first. 404 with `not_found_detail`
+    when the first page is empty.
     """
-    serialized = AggregatedRateSerializer(rates_queryset, many=True).data
-    for item, obj in zip(serialized, rates_queryset):
-        item['fetched_at'] = localtime(obj.fetched_at).isoformat()
-    return serialized
+    paginator = KeysetPaginator(request)
+    rows = paginator.page_queryset(rates.values_list(*RATE_FIELDS, named=True))
+    page, next_cursor, previous_cursor = paginator.build_page(rows)
+    if not page and paginator.is_first_page:
+        return Response({"detail": not_found_detail}, status=404)
+    return Response(paginator.get_response_data(rates, serialize_rates(page), next_cursor, previous_cursor))
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
 def list_rates(request):
     """
-    List all rates (latest first) with count.
+    List all rates (latest first), one keyset page at a time.
+    Optional query params: ?cursor=, ?page_size=, ?count=exact|estimate
     """
-    rates = AggregatedRate.objects.all().order_by('-fetched_at')
-    serialized = serialize_rates(rates)
-    return Response({
-        "count": rates.count(),
-        "results": serialized
-    })
+    return paginated_response(request, AggregatedRate.objects.all(), "No rates found.")
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
 def rates_for_currency(request, currency):
     """
-    Rates filtered by currency (as base or target) with count.
+    Rates filtered by currency (as base or target), paginated like list_rates.
     """
     currency = currency.upper()
     rates = AggregatedRate.objects.filter(
-        Q(base_currency__iexact=currency) | Q(target_currency__iexact=currency)
-    ).order_by('-fetched_at')
-
-    if not rates.exists():
-        return Response({"detail": f"No rates found for currency '{currency}'"}, status=404)
-
-    serialized = serialize_rates(rates)
-    return Response({
-        "count": rates.count(),
-        "results": serialized
-    })
+        Q(base_currency=currency) | Q(target_currency=currency)
+    )
+    return paginated_response(request, rates, f"No rates found for currency '{currency}'")
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
 def latest_rates_all(request):
     """
     Latest rates for all currencies with count.
     """
-    latest_time = AggregatedRate.objects.order_by('-fetched_at').values_list('fetched_at', flat=True).first()
-    if not latest_time:
+    rates = list(
+        LatestRate.objects.order_by('base_currency', 'target_currency').values_list(*LATEST_RATE_FIELDS)
+    )
+    if not rates:
         return Response({"detail": "No rates found."}, status=404)
 
-    rates = AggregatedRate.objects.filter(fetched_at=latest_time).order_by('base_currency', 'target_currency')
-    serialized = serialize_rates(rates)
     return Response({
-        "count": rates.count(),
-        "results": serialized
+        "count": len(rates),
+        "results": serialize_rates(rates)
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
 def latest_rates_currency(request, currency):
     """
     Latest rates for a specific currency (base or target) with count.
     """
-    latest_time = AggregatedRate.objects.order_by('-fetched_at').values_list('fetched_at', flat=True).first()
-    if not latest_time:
-        return Response({"detail": "No rates found."}, status=404)
-
     currency = currency.upper()
-    rates = AggregatedRate.objects.filter(fetched_at=latest_time).filter(base_currency__iexact=currency) | \
-            AggregatedRate.objects.filter(fetched_at=latest_time, target_currency__iexact=currency)
-    rates = rates.order_by('base_currency', 'target_currency')
-
-    if not rates.exists():
+    rates = list(
+        LatestRate.objects.filter(Q(base_currency=currency) | Q(target_currency=currency))
+        .order_by('base_currency', 'target_currency')
+        .values_list(*LATEST_RATE_FIELDS)
+    )
+    if not rates:
         return Response({"detail": f"No latest rates found for currency '{currency}'"}, status=404)
 
-    serialized = serialize_rates(rates)
     return Response({
-        "count": rates.count(),
-        "results": serialized
+        "count": len(rates),
+        "results": serialize_rates(rates)
     })
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
 def historical_rates_all(request):
     """
-    Historical rates with optional filtering by currency and date, with count.
+    Historical rates with optional filtering by currency and date, paginated
+    like list_rates.
     Optional query params:
         ?currency=USD
         ?date=YYYY-MM-DD (in CAT)
@@ -112,29 +169,298 @@ def historical_rates_all(request):
 
     if currency:
         currency = currency.upper()
-        rates = rates.filter(Q(base_currency__iexact=currency) | Q(target_currency__iexact=currency))
+        rates = rates.filter(Q(base_currency=currency) | Q(target_currency=currency))
 
     if date_str:
         try:
-            local_date = datetime.strptime(date_str, "%Y-%m-%d")
-            tz = timezone.get_current_timezone()  # should be CAT if TIME_ZONE='Africa/Harare'
-            start = timezone.make_aware(datetime.combine(local_date, time.min), tz)
-            end = timezone.make_aware(datetime.combine(local_date, time.max), tz)
-            rates = rates.filter(fetched_at__range=(start, end))
+            start, end = local_day_bounds(date_str)
         except ValueError:
             return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+        rates = rates.filter(fetched_at__range=(start, end))
+
+    not_found_detail = (
+        f"No historical rates found for currency '{currency}' on date '{date_str}'"
+        if currency or date_str else "No historical rates found."
+    )
+    return paginated_response(request, rates, not_found_detail)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@ignore_accept
+def export_rates(request, export_format):
+    """
+    Stream historical rates, oldest first, as CSV or NDJSON.
+    Rows are read through a server-side cursor, so memory use does not grow
+    with the size of the export. The format comes from the URL, so the
+    Accept header is not negotiated; errors are always JSON.
+    Optional query params:
+        ?currency=USD
+        ?start=YYYY-MM-DD, ?end=YYYY-MM-DD (inclusive, in CAT)
+    """
+    if export_format not in EXPORT_FORMATS:
+        return Response(
+            {"detail": f"Unsupported export format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}."},
+            status=400
+        )
+
+    rates = AggregatedRate.objects.all()
+    currency = request.GET.get('currency', None)
+    if currency:
+        currency = currency.upper()
+        rates = rates.filter(Q(base_currency=currency) | Q(target_currency=currency))
+
+    try:
+        if request.GET.get('start'):
+            rates = rates.filter(fetched_at__gte=local_day_bounds(request.GET['start'])[0])
+        if request.GET.get('end'):
+            rates = rates.filter(fetched_at__lte=local_day_bounds(request.GET['end'])[1])
+    except ValueError:
+        return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+    rows = rates.order_by('fetched_at', 'id').values_list(*RATE_FIELDS).iterator(
+        chunk_size=settings.RATES_EXPORT_CHUNK_SIZE
+    )
+    stream, content_type = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(stream(iter_serialized_rates(rows)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="rates.{export_format}"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+@cached_rates_response
+def ohlc_rates(request):
+    """
+    Open/high/low/close/average of a pair's average_rate per time bucket,
+    oldest first, read from the RateRollup table.
+    Query params:
+        ?base=USD&target=GBP (required)
+        ?bucket=1m|5m|1h|1d (default 1h)
+        ?start=YYYY-MM-DD, ?end=YYYY-MM-DD (inclusive, in CAT)
+    At most RATES_MAX_PAGE_SIZE buckets (the most recent) are returned.
+    """
+    base = request.GET.get('base', '').upper()
+    target = request.GET.get('target', '').upper()
+    bucket = request.GET.get('bucket', '1h')
+    if not base or not target:
+        return Response({"detail": "Both 'base' and 'target' are required."}, status=400)
+    if bucket not in BUCKETS:
+        return Response({"detail": f"Invalid bucket '{bucket}'. Use one of: {', '.join(BUCKETS)}."}, status=400)
+
+    rollups = RateRollup.objects.filter(base_currency=base, target_currency=target, bucket=bucket)
+    try:
+        if request.GET.get('start'):
+            rollups = rollups.filter(bucket_start__gte=local_day_bounds(request.GET['start'])[0])
+        if request.GET.get('end'):
+            rollups = rollups.filter(bucket_start__lte=local_day_bounds(request.GET['end'])[1])
+    except ValueError:
+        return Response({"detail": "Invalid date format. Use YYYY-MM-DD."}, status=400)
+
+    rows = list(rollups.order_by('-bucket_start').values_list(
+        'bucket_start', 'open_rate', 'high_rate', 'low_rate', 'close_rate', 'rate_sum', 'sample_count'
+    )[:settings.RATES_MAX_PAGE_SIZE])
+    if not rows:
+        return Response({"detail": f"No rates found for {base}->{target}."}, status=404)
+
+    rows.reverse()
+    results = [
+        {
+            "bucket_start": localtime(start).isoformat(),
+            "open": format_rate(open_rate),
+            "high": format_rate(high_rate),
+            "low": format_rate(low_rate),
+            "close": format_rate(close_rate),
+            "average": format_rate(rate_sum / sample_count),
+            "samples": sample_count,
+        }
+        for start, open_rate, high_rate, low_rate, close_rate, rate_sum, sample_count in rows
+    ]
+    return Response({
+        "base_currency": base,
+        "target_currency": target,
+        "bucket": bucket,
+        "count": len(results),
+        "results": results
+    })
+
+
+# Amounts and converted amounts are quantized to cents in a 28-digit Decimal
+# context; this bound keeps amount * rate well inside it
+MAX_QUOTE_AMOUNT = Decimal("1e15")
+
+
+def parse_amount(value):
+    """A non-negative finite Decimal amount below MAX_QUOTE_AMOUNT; raises ValueError otherwise."""
+    try:
+        amount = Decimal(str(value))
+    except InvalidOperation:
+        raise ValueError(value)
+    if not amount.is_finite() or amount < 0 or amount >= MAX_QUOTE_AMOUNT:
+        raise ValueError(value)
+    return amount
+
+
+def lookup_quote_rate(base, target):
+    """
+    The matrix rate for base->target.
+    Returns:
+        (matrix, rate, None) or (None, None, error Response)
+    """
+    if not base or not target:
+        return None, None, Response({"detail": "Both 'base' and 'target' are required."}, status=400)
+    if base == target:
+        return None, None, Response({"detail": "'base' and 'target' must differ."}, status=400)
+    matrix = get_matrix()
+    if matrix is None:
+        return None, None, Response({"detail": "No rates found."}, status=404)
+    rate = matrix.get(base, target)
+    if rate is None:
+        return None, None, Response({"detail": f"No rate available for {base}->{target}."}, status=404)
+    return matrix, rate, None
+
+
+def quote_header(matrix, base, target, rate):
+    return {
+        "base_currency": base,
+        "target_currency": target,
+        "average_rate": format_rate(rate.average_rate),
+        "markup_rate": format_rate(rate.markup_rate),
+        "derivation": rate.derivation,
+        "fetched_at": localtime(rate.fetched_at).isoformat(),
+        "snapshot_version": matrix.version,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+def quote_rate(request):
+    """
+    Convert an amount from base to target at the latest rates, served from
+    the in-memory rate matrix (inverse and cross pairs included).
+    Query params:
+        ?base=USD&target=GBP&amount=100 (all required)
+    """
+    base = request.GET.get('base', '').upper()
+    target = request.GET.get('target', '').upper()
+    try:
+        amount = parse_amount(request.GET.get('amount', ''))
+    except ValueError:
+        return Response({"detail": f"'amount' must be a non-negative number below {MAX_QUOTE_AMOUNT:,.0f}."}, status=400)
+
+    matrix, rate, error = lookup_quote_rate(base, target)
+    if error is not None:
+        return error
+
+    return Response({
+        **quote_header(matrix, base, target, rate),
+        "amount": f"{quantize_amount(amount)}",
+        "converted_amount": f"{quantize_amount(amount * rate.markup_rate)}",
+    })
 
-    rates = rates.order_by('-fetched_at', 'base_currency', 'target_currency')
 
-    if not rates.exists():
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+def quote_batch(request):
+    """
+    quote_rate for many amounts of one pair at once.
+    Body:
+        {"base": "USD", "target": "GBP", "amounts": [100, "250.50", ...]}
+    At most RATES_MAX_QUOTE_AMOUNTS amounts per request.
+    """
+    if not isinstance(request.data, dict):
+        return Response({"detail": "The body must be a JSON object."}, status=400)
+    base = str(request.data.get('base', '')).upper()
+    target = str(request.data.get('target', '')).upper()
+    amounts = request.data.get('amounts')
+    if not isinstance(amounts, list) or not amounts:
+        return Response({"detail": "'amounts' must be a non-empty list."}, status=400)
+    if len(amounts) > settings.RATES_MAX_QUOTE_AMOUNTS:
+        return Response({"detail": f"At most {settings.RATES_MAX_QUOTE_AMOUNTS} amounts per request."}, status=400)
+    try:
+        amounts = [parse_amount(amount) for amount in amounts]
+    except ValueError as e:
         return Response(
-            {"detail": f"No historical rates found for currency '{currency}' on date '{date_str}'"} 
-            if currency or date_str else {"detail": "No historical rates found."},
-            status=404
+            {"detail": f"Invalid amount {e}; amounts must be non-negative numbers below {MAX_QUOTE_AMOUNT:,.0f}."},
+            status=400
         )
 
-    serialized = serialize_rates(rates)
+    matrix, rate, error = lookup_quote_rate(base, target)
+    if error is not None:
+        return error
+
+    markup_rate = rate.markup_rate
     return Response({
-        "count": rates.count(),
-        "results": serialized
+        **quote_header(matrix, base, target, rate),
+        "count": len(amounts),
+        "results": [
+            {"amount": f"{quantize_amount(amount)}", "converted_amount": f"{quantize_amount(amount * markup_rate)}"}
+            for amount in amounts
+        ],
     })
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+@renderer_classes([FastJSONRenderer])
+def rates_lookup(request):
+    """
+    The rate in effect for each (pair, time): the newest rate of the pair
+    fetched at or before that time. All lookups are resolved in one query.
+    Body:
+        {"lookups": [{"base": "USD", "target": "GBP", "at": "2025-09-01T12:00:00+02:00"}, ...]}
+    Times without an offset are in CAT. At most RATES_MAX_LOOKUPS lookups per
+    request; results come back in request order, with null rate fields where
+    the pair had no rate yet.
+    """
+    lookups = request.data.get('lookups') if isinstance(request.data, dict) else None
+    if not isinstance(lookups, list) or not lookups:
+        return Response({"detail": "'lookups' must be a non-empty list."}, status=400)
+    if len(lookups) > settings.RATES_MAX_LOOKUPS:
+        return Response({"detail": f"At most {settings.RATES_MAX_LOOKUPS} lookups per request."}, status=400)
+
+    parsed = []
+    for i, lookup in enumerate(lookups):
+        if not isinstance(lookup, dict) or not lookup.get('base') or not lookup.get('target'):
+            return Response({"detail": f"Lookup {i}: 'base', 'target' and 'at' are required."}, status=400)
+        try:
+            at = parse_datetime(str(lookup.get('at', '')))
+        except ValueError:
+            at = None
+        if at is None:
+            return Response({"detail": f"Lookup {i}: 'at' must be an ISO 8601 datetime."}, status=400)
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        parsed.append((str(lookup['base']).upper(), str(lookup['target']).upper(), at))
+
+    results = []
+    for (base, target, at), rate in zip(parsed, rates_as_of(parsed)):
+        results.append({
+            "base_currency": base,
+            "target_currency": target,
+            "at": localtime(at).isoformat(),
+            "id": rate.id if rate else None,
+            "average_rate": format_rate(rate.average_rate) if rate else None,
+            "markup_rate": format_rate(rate.markup_rate) if rate else None,
+            "fetched_at": localtime(rate.fetched_at).isoformat() if rate else None,
+        })
+    return Response({"count": len(results), "results": results})
+
+
+@require_GET
+def metrics(request):
+    """
+    This process's metrics in Prometheus text format. Scrapers must send
+    `Authorization: Bearer <settings.METRICS_TOKEN>`; without a configured
+    token the endpoint is disabled (403).
+    """
+    refusal = scrape_refusal(request.headers.get('Authorization', ''))
+    if refusal == 403:
+        return HttpResponse("Metrics are disabled: METRICS_TOKEN is not set\n", status=403, content_type="text/plain")
+    if refusal is not None:
+        return HttpResponse("Unauthorized\n", status=401, content_type="text/plain")
+    return HttpResponse(REGISTRY.render(), content_type=METRICS_CONTENT_TYPE)
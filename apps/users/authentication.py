@@ -1,19 +1,165 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework.exceptions import AuthenticationFailed
 
+from .models import TokenRevocation
+
+
+def user_cache_key(user_id):
+    return f"auth:user:{user_id}"
+
+
+def revoked_key(user_id):
+    return f"auth:revoked:{user_id}"
+
+
+def revoke_user_tokens(user_id):
+    """
+    Reject access tokens issued to `user_id` up to now, and drop the cached
+    user. Called when one of the user's refresh tokens is blacklisted.
+    """
+    revoked_before = int(time.time())
+    TokenRevocation.objects.update_or_create(user_id=user_id, defaults={'revoked_before': revoked_before})
+    cache.set(revoked_key(user_id), revoked_before, timeout=settings.JWT_REVOCATION_CACHE_TTL)
+    cache.delete(user_cache_key(user_id))
+
+
+def get_revoked_before(user_id):
+    """
+    Unix time up to which `user_id`'s access tokens are revoked, 0 if never.
+    Read from TokenRevocation and cached for settings.JWT_REVOCATION_CACHE_TTL
+    seconds, so other processes see a new revocation within that time.
+    """
+    revoked_before = cache.get(revoked_key(user_id))
+    if revoked_before is None:
+        revoked_before = TokenRevocation.objects.filter(user_id=user_id).values_list(
+            'revoked_before', flat=True
+        ).first() or 0
+        cache.set(revoked_key(user_id), revoked_before, timeout=settings.JWT_REVOCATION_CACHE_TTL)
+    return revoked_before
+
+
+class AuthStats:
+    """Thread-safe counters and timings for CookiesJWTAuthentication."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.authenticated = 0
+        self.failed = 0
+        self.token_cache_hits = 0
+        self.token_cache_misses = 0
+        self.seconds = 0.0
+
+    def record(self, seconds, ok):
+        with self._lock:
+            if ok:
+                self.authenticated += 1
+            else:
+                self.failed += 1
+            self.seconds += seconds
+
+    def record_token_lookup(self, hit):
+        with self._lock:
+            if hit:
+                self.token_cache_hits += 1
+            else:
+                self.token_cache_misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            total = self.authenticated + self.failed
+            return {
+                "authenticated": self.authenticated,
+                "failed": self.failed,
+                "token_cache_hits": self.token_cache_hits,
+                "token_cache_misses": self.token_cache_misses,
+                "seconds_total": self.seconds,
+                "seconds_avg": self.seconds / total if total else 0.0,
+            }
+
+
+class TokenCache:
+    """
+    Validated access tokens by raw token string, kept in process until they
+    expire, so each token's signature is checked and its payload decoded
+    once. Holds at most `max_size` tokens; the oldest are evicted first.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, raw_token):
+        with self._lock:
+            entry = self._tokens.get(raw_token)
+            if entry is None:
+                return None
+            token, expires_at = entry
+            if expires_at <= time.time():
+                del self._tokens[raw_token]
+                return None
+            return token
+
+    def set(self, raw_token, token):
+        with self._lock:
+            self._tokens[raw_token] = (token, token['exp'])
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+
+auth_stats = AuthStats()
+token_cache = TokenCache(settings.JWT_TOKEN_CACHE_SIZE)
+
+
 class CookiesJWTAuthentication(JWTAuthentication):
     """
-    Authenticate using JWT in HttpOnly cookies with CSRF check.
+    Authenticate using JWT in HttpOnly cookies with CSRF check, falling
+    back to an "Authorization: Bearer" header when no cookie is sent.
+
+    With settings.JWT_TRUST_TOKEN_CLAIMS the user is built from the token's
+    signed claims (user id, username, is_active) and no user query is made;
+    otherwise user rows are cached for settings.JWT_USER_CACHE_TTL seconds.
+    Either way, tokens issued before the user's last revocation
+    (TokenRevocation) are refused.
+    Validated tokens are cached in process (TokenCache) and every call is
+    timed in auth_stats.
     """
 
     def authenticate(self, request):
         access_token = request.COOKIES.get('access_token')
-        if not access_token:
-            return None
+        from_cookie = bool(access_token)
+        if not from_cookie:
+            # Clients without cookies send "Authorization: Bearer <token>"
+            header = self.get_header(request)
+            access_token = self.get_raw_token(header) if header is not None else None
+            if access_token is None:
+                return None
+
+        start = time.perf_counter()
+        ok = False
+        try:
+            result = self._authenticate(request, access_token, check_csrf=from_cookie)
+            ok = True
+            return result
+        finally:
+            auth_stats.record(time.perf_counter() - start, ok)
 
-        # CSRF check for unsafe methods
-        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+    def _authenticate(self, request, access_token, check_csrf=True):
+        # CSRF check for unsafe methods; a header token is not sent by the browser on its own
+        if check_csrf and request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
             csrf_token_cookie = request.COOKIES.get('csrf_token')
             csrf_token_header = request.headers.get('X-CSRFToken')
             if csrf_token_cookie != csrf_token_header:
@@ -25,3 +171,33 @@ class CookiesJWTAuthentication(JWTAuthentication):
             return (user, validated_token)
         except TokenError as e:
             raise AuthenticationFailed("Invalid or expired JWT") from e
+
+    def get_validated_token(self, raw_token):
+        token = token_cache.get(raw_token)
+        auth_stats.record_token_lookup(hit=token is not None)
+        if token is None:
+            token = super().get_validated_token(raw_token)
+            token_cache.set(raw_token, token)
+        return token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        revoked_before = get_revoked_before(user_id)
+        # iat has one-second resolution: tokens from the revocation's own second are refused too
+        if revoked_before and validated_token.get('iat', 0) <= revoked_before:
+            raise AuthenticationFailed("Token has been revoked.")
+
+        # Tokens issued before the claims were added fall back to a lookup
+        if settings.JWT_TRUST_TOKEN_CLAIMS and 'username' in validated_token:
+            if not validated_token.get('is_active', True):
+                raise AuthenticationFailed("User is inactive")
+            return TokenUser(validated_token)
+
+        if not settings.JWT_USER_CACHE_TTL:
+            return super().get_user(validated_token)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, timeout=settings.JWT_USER_CACHE_TTL)
+        return user
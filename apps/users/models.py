@@ -1,2 +1,15 @@
 from django.db import models
-from django.contrib.auth.models import User
\ No newline at end of file
+from django.contrib.auth.models import User
+
+
+class TokenRevocation(models.Model):
+    """
+    Access tokens of `user` issued at or before `revoked_before` (Unix time,
+    compared with the token's iat claim) are refused. Stored in the database
+    so every process sees a logout, whatever the cache backend.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='+')
+    revoked_before = models.PositiveBigIntegerField()
+
+    def __str__(self):
+        return f"{self.user_id} revoked before {self.revoked_before}"
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 # from rest_framework_simplejwt.tokens import RefreshToken
 
 
@@ -22,4 +23,19 @@ class UserRegisterSerializer(serializers.ModelSerializer):
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
-        fields = ['username']
\ No newline at end of file
+        fields = ['username']
+
+
+class ClaimsTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """
+    Adds username and is_active claims, so CookiesJWTAuthentication can
+    build the user from the token (settings.JWT_TRUST_TOKEN_CLAIMS).
+    Refreshed access tokens copy them from the refresh token.
+    """
+
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['is_active'] = user.is_active
+        return token
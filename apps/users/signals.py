@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import revoke_user_tokens, user_cache_key
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def revoke_on_blacklist(sender, instance, created, **kwargs):
+    """A blacklisted refresh token also ends the user's outstanding access tokens."""
+    if created and instance.token.user_id is not None:
+        revoke_user_tokens(instance.token.user_id)
+
+
+@receiver(post_save, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    """Keep the authentication user cache from serving a stale row."""
+    cache.delete(user_cache_key(instance.pk))
@@ -1,3 +1,80 @@
-from django.test import TestCase
+import time
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from .authentication import token_cache
+from .models import TokenRevocation
+
+
+class AuthTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        User.objects.create_user(username='tester', password='secret-pass-123')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/login/', {'username': 'tester', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        return response.json()['access']
+
+    def logout(self):
+        return self.client.post('/api/logout/', HTTP_X_CSRFTOKEN=self.client.cookies['csrf_token'].value)
+
+
+class RevocationTests(AuthTestCase):
+    def test_logout_revokes_access_token(self):
+        access = self.login()
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 200)
+        self.assertEqual(self.logout().status_code, 200)
+        self.assertTrue(TokenRevocation.objects.exists())
+
+        self.client.cookies['access_token'] = access
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 401)
+
+    def test_revocation_survives_losing_the_cache(self):
+        # Another process (per-process cache) or an evicted cache entry
+        access = self.login()
+        self.logout()
+        cache.clear()
+
+        self.client.cookies['access_token'] = access
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 401)
+
+    @override_settings(JWT_REVOCATION_CACHE_TTL=0)
+    def test_revocation_from_another_process_applies(self):
+        self.login()
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 200)
+        user = User.objects.get(username='tester')
+        TokenRevocation.objects.create(user=user, revoked_before=int(time.time()))
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 401)
+
+
+class HeaderAuthenticationTests(AuthTestCase):
+    def setUp(self):
+        super().setUp()
+        access = self.login()
+        self.client = APIClient()  # no cookies
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_bearer_header_is_accepted(self):
+        response = self.client.get('/api/is-logged-in/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'username': 'tester'})
+
+    def test_logout_with_bearer_header_needs_no_csrf_token(self):
+        self.assertEqual(self.client.post('/api/logout/').status_code, 200)
+
+    def test_invalid_bearer_header_is_refused(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(self.client.get('/api/is-logged-in/').status_code, 401)
+
+
+class CookieAuthenticationTests(AuthTestCase):
+    def test_unsafe_cookie_request_needs_csrf_token(self):
+        self.login()
+        self.assertEqual(self.client.post('/api/logout/').status_code, 401)
+        self.assertEqual(self.logout().status_code, 200)
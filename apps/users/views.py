@@ -4,20 +4,11 @@ from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import RefreshToken
 from django.views.decorators.csrf import csrf_exempt
-from .serializers import UserRegisterSerializer, UserSerializer
-
-
-# -------------------------
-# Custom JWT authentication for cookies
-# -------------------------
-class CookiesJWTAuthentication(JWTAuthentication):
-    def authenticate(self, request):
-        access_token = request.COOKIES.get('access_token')
-        if access_token:
-            request.META['HTTP_AUTHORIZATION'] = f'Bearer {access_token}'
-        return super().authenticate(request)
+from .authentication import CookiesJWTAuthentication
+from .serializers import ClaimsTokenObtainPairSerializer, UserRegisterSerializer, UserSerializer
 
 
 # -------------------------
@@ -39,6 +30,8 @@ def register(request):
 # Token Obtain (login)
 # -------------------------
 class CustomTokenObtainPairView(TokenObtainPairView):
+    serializer_class = ClaimsTokenObtainPairSerializer
+
     def post(self, request, *args, **kwargs):
         response = super().post(request, *args, **kwargs)
         tokens = response.data
@@ -82,6 +75,14 @@ class CustomTokenRefreshView(TokenRefreshView):
 @authentication_classes([CookiesJWTAuthentication])
 @permission_classes([IsAuthenticated])
 def logout(request):
+    # Blacklisting the refresh token also revokes outstanding access tokens (see signals.py)
+    refresh_token = request.COOKIES.get('refresh_token')
+    if refresh_token:
+        try:
+            RefreshToken(refresh_token).blacklist()
+        except TokenError:
+            pass  # already expired or blacklisted
+
     res = Response({'success': True})
     res.delete_cookie('access_token', path='/', samesite='None')
     res.delete_cookie('refresh_token', path='/', samesite='None')
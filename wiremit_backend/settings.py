@@ -24,6 +24,96 @@ FASTFOREX_KEY = os.getenv("FASTFOREX_KEY")
 APILAYER_KEY = os.getenv("APILAYER_KEY")
 MARKUP_RATE = float(os.getenv("MARKUP_RATE", 0.10))
 
+# Currency universe requested from every provider. Pairs stored each cycle are
+# whitelisted in the CurrencyPair table (editable in the admin).
+RATES_CURRENCIES = [c.strip().upper() for c in os.getenv("RATES_CURRENCIES", "USD,GBP,ZAR").split(",") if c.strip()]
+
+# Seconds between aggregation cycles. The cross-process lease (apps/rates/locks.py)
+# allows one cycle per interval across all workers; it is held for RATES_LEASE_TTL
+# seconds at a time and renewed while the cycle runs.
+RATES_AGGREGATION_INTERVAL = int(os.getenv("RATES_AGGREGATION_INTERVAL", 60))
+RATES_LEASE_TTL = int(os.getenv("RATES_LEASE_TTL", 60))
+
+# Seconds an aggregation cycle waits for providers before storing what arrived
+RATES_CYCLE_DEADLINE = float(os.getenv("RATES_CYCLE_DEADLINE", 20))
+
+# Consensus across providers (apps/rates/consensus.py)
+RATES_AGGREGATION_METHOD = os.getenv("RATES_AGGREGATION_METHOD", "weighted_mean")  # mean, median, trimmed_mean, weighted_mean
+RATES_TRIM_FRACTION = float(os.getenv("RATES_TRIM_FRACTION", 0.2))
+RATES_OUTLIER_MAD_THRESHOLD = float(os.getenv("RATES_OUTLIER_MAD_THRESHOLD", 3.5))
+RATES_MAX_QUOTE_AGE = int(os.getenv("RATES_MAX_QUOTE_AGE", 2 * 60 * 60))  # seconds
+RATES_PROVIDER_WEIGHTS = {
+    "CurrencyFreaks": 1,
+    "FastForex": 1,
+    "API Layer": 1,
+}
+
+# Per-provider circuit breakers (apps/rates/breaker.py), shared through CACHES
+RATES_BREAKER_FAILURE_THRESHOLD = int(os.getenv("RATES_BREAKER_FAILURE_THRESHOLD", 3))  # failed cycles before opening
+RATES_BREAKER_COOLDOWN = int(os.getenv("RATES_BREAKER_COOLDOWN", 60))  # seconds
+RATES_BREAKER_MAX_COOLDOWN = int(os.getenv("RATES_BREAKER_MAX_COOLDOWN", 3600))  # seconds
+
+# Provider-side quote cache and quota ledger (apps/rates/provider_cache.py). A provider
+# is called at most once per min interval (seconds), and no more often than its
+# remaining monthly quota allows; None means no quota is tracked.
+RATES_PROVIDER_MIN_INTERVAL = {
+    "CurrencyFreaks": int(os.getenv("CURRENCYFREAKS_MIN_INTERVAL", 0)),
+    "FastForex": int(os.getenv("FASTFOREX_MIN_INTERVAL", 0)),
+    "API Layer": int(os.getenv("APILAYER_MIN_INTERVAL", 0)),
+}
+RATES_PROVIDER_MONTHLY_QUOTA = {
+    "CurrencyFreaks": int(os.getenv("CURRENCYFREAKS_MONTHLY_QUOTA")) if os.getenv("CURRENCYFREAKS_MONTHLY_QUOTA") else None,
+    "FastForex": int(os.getenv("FASTFOREX_MONTHLY_QUOTA")) if os.getenv("FASTFOREX_MONTHLY_QUOTA") else None,
+    "API Layer": int(os.getenv("APILAYER_MONTHLY_QUOTA")) if os.getenv("APILAYER_MONTHLY_QUOTA") else None,
+}
+
+# Pooled keep-alive HTTP sessions used for provider calls (apps/rates/clients.py)
+RATES_HTTP_POOL_SIZE = int(os.getenv("RATES_HTTP_POOL_SIZE", 2))
+RATES_HTTP_CONNECT_TIMEOUT = float(os.getenv("RATES_HTTP_CONNECT_TIMEOUT", 3.05))
+RATES_HTTP_READ_TIMEOUT = float(os.getenv("RATES_HTTP_READ_TIMEOUT", 10))
+
+# Rows per INSERT statement when a snapshot is written
+RATES_BULK_BATCH_SIZE = int(os.getenv("RATES_BULK_BATCH_SIZE", 500))
+
+# Read-through cache for the rate endpoints (apps/rates/caching.py). The snapshot
+# marker is re-read from the database at most every RATES_SNAPSHOT_CACHE_TTL seconds
+# when the aggregator runs in another process without a shared cache.
+RATES_SNAPSHOT_CACHE_TTL = int(os.getenv("RATES_SNAPSHOT_CACHE_TTL", 5))
+RATES_RESPONSE_CACHE_TTL = int(os.getenv("RATES_RESPONSE_CACHE_TTL", 600))
+
+# Quote endpoints (apps/rates/matrix.py): seconds between snapshot version checks
+# of the in-process rate matrix, and amounts accepted per batch quote
+RATES_MATRIX_CHECK_INTERVAL = float(os.getenv("RATES_MATRIX_CHECK_INTERVAL", 1))
+RATES_MAX_QUOTE_AMOUNTS = int(os.getenv("RATES_MAX_QUOTE_AMOUNTS", 1000))
+
+# As-of lookups accepted per POST /api/rates/lookup/ (apps/rates/lookups.py)
+RATES_MAX_LOOKUPS = int(os.getenv("RATES_MAX_LOOKUPS", 1000))
+
+# Server-Sent Events stream (apps/rates/stream.py): how often each process checks
+# for a new snapshot, keepalive comment interval, and client reconnect delay
+RATES_STREAM_POLL_INTERVAL = float(os.getenv("RATES_STREAM_POLL_INTERVAL", 1))
+RATES_STREAM_HEARTBEAT = float(os.getenv("RATES_STREAM_HEARTBEAT", 15))
+RATES_STREAM_RETRY_MS = int(os.getenv("RATES_STREAM_RETRY_MS", 3000))
+
+# Retention (apps/rates/retention.py, `manage.py prune_rates`). Raw rows older than
+# RATES_RAW_RETENTION_DAYS are compacted into rollups and deleted in batches;
+# rollups are kept per bucket for the given days (None keeps them forever).
+RATES_RAW_RETENTION_DAYS = int(os.getenv("RATES_RAW_RETENTION_DAYS", 30))
+RATES_RETENTION_BATCH_SIZE = int(os.getenv("RATES_RETENTION_BATCH_SIZE", 5000))
+RATES_ROLLUP_RETENTION_DAYS = {
+    '1m': 7,
+    '5m': 90,
+    '1h': 730,
+    '1d': None,
+}
+
+# Keyset pagination of the rate list endpoints
+RATES_PAGE_SIZE = int(os.getenv("RATES_PAGE_SIZE", 100))
+RATES_MAX_PAGE_SIZE = int(os.getenv("RATES_MAX_PAGE_SIZE", 1000))
+
+# Rows fetched per round-trip by the server-side cursor of the export endpoint
+RATES_EXPORT_CHUNK_SIZE = int(os.getenv("RATES_EXPORT_CHUNK_SIZE", 2000))
+
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,7 +143,37 @@ extra_hosts = os.getenv('ALLOWED_HOSTS', '')
 if extra_hosts:
     ALLOWED_HOSTS.extend([host.strip() for host in extra_hosts.split(',')])
 
-SCHEDULER_AUTOSTART = True
+# Start APScheduler inside every process that loads Django (web workers included).
+# Off by default: run the dedicated `manage.py run_rate_worker` process instead.
+SCHEDULER_AUTOSTART = os.getenv("SCHEDULER_AUTOSTART", "false").lower() in ("1", "true", "yes")
+
+# Prometheus metrics (apps/rates/metrics.py). GET /api/metrics/ requires
+# "Authorization: Bearer <METRICS_TOKEN>" and is disabled while it is unset; the
+# worker can serve its own metrics on RATES_WORKER_METRICS_PORT (0 = off)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+RATES_WORKER_METRICS_PORT = int(os.getenv("RATES_WORKER_METRICS_PORT", 0))
+
+# Dedicated worker (`manage.py run_rate_worker`): log file, daily retention time (CAT)
+# and an optional file rewritten with the worker's health after every cycle
+RATES_WORKER_LOG_FILE = os.getenv("RATES_WORKER_LOG_FILE", "forex_aggregation.log")
+RATES_RETENTION_TIME = os.getenv("RATES_RETENTION_TIME", "02:30")
+RATES_WORKER_HEALTH_FILE = os.getenv("RATES_WORKER_HEALTH_FILE", "")
+
+# Shared cache. Defaults to the per-process LocMem cache (fine for tests and a
+# single process); point it at Redis when running several workers, e.g.
+# CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+# CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+# Processes that call the providers (run_rate_worker, fetch_forex_rates, the
+# autostarted scheduler) refuse to start on a per-process cache, since the
+# provider circuit breakers and quota ledgers live in it; true allows it for a
+# single process
+RATES_ALLOW_LOCAL_CACHE = os.getenv("RATES_ALLOW_LOCAL_CACHE", "false").lower() in ("1", "true", "yes")
 
 
 
@@ -94,6 +214,16 @@ REST_FRAMEWORK = {
     ]
 }
 
+# Authentication (apps/users/authentication.py). JWT_TRUST_TOKEN_CLAIMS builds the
+# request user from the access token's signed claims instead of querying auth_user;
+# otherwise user rows are cached for JWT_USER_CACHE_TTL seconds (0 disables).
+JWT_TRUST_TOKEN_CLAIMS = os.getenv("JWT_TRUST_TOKEN_CLAIMS", "false").lower() in ("1", "true", "yes")
+JWT_USER_CACHE_TTL = int(os.getenv("JWT_USER_CACHE_TTL", 60))
+JWT_TOKEN_CACHE_SIZE = int(os.getenv("JWT_TOKEN_CACHE_SIZE", 10000))  # validated tokens kept per process
+# Logout revocations are stored in the database and cached per user for this many
+# seconds; other processes honour a new logout within this time (0 = check every request)
+JWT_REVOCATION_CACHE_TTL = int(os.getenv("JWT_REVOCATION_CACHE_TTL", 10))
+
 ROOT_URLCONF = 'wiremit_backend.urls'
 
 TEMPLATES = [